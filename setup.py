@@ -29,5 +29,11 @@ with open("README.md", "r", encoding="utf-8") as freadme, open("version.txt", "r
       'ftputil>=5.0.1,<6'
       
     ],
+    extras_require={
+      # rfslib.potel_tracer
+      'opentelemetry': ['opentelemetry-api>=1.0,<2'],
+      # --profile uses the sampling profiler instead of cProfile
+      'profiling': ['pyinstrument>=5,<6'],
+    },
     scripts=[*map(lambda x: 'bin/' + x, os.listdir('bin'))],
   )
@@ -1,4 +1,5 @@
 import configargparse
+from rfslib.default_paths import default_socket_path, default_cache_path
 from os.path import expanduser
 from os import environ
 
@@ -62,11 +63,48 @@ def default_arg_parser(description:str='', wildcard_skipper=False) -> configargp
   ret.add('--skip-validation', help='NOT IMPLEMENTED YET. If enabled, some validations of input will be skipped. Undefined behavior may happen if input is wrong. Increses performance.',
     env_var='RFSTOOLS_SKIP_VALIDATION', action='store_true')
 
+  ret.add('--metadata-cache', help='Enables caching of remote metadata lookups (existence, type and stat of files) for the time of the command. It saves round trips on high-latency connections, ' +
+    'but changes made by other clients during the command may stay unnoticed.', action='store_true', env_var='RFSTOOLS_METADATA_CACHE')
+  ret.add('--metadata-cache-ttl', help='Time in seconds, after which a cached metadata entry expires. Defaults to 5.', type=float, default=5.0, env_var='RFSTOOLS_METADATA_CACHE_TTL')
+  ret.add('--metadata-cache-size', help='Maximal number of paths held in the metadata cache. Defaults to 4096.', type=int, default=4096, env_var='RFSTOOLS_METADATA_CACHE_SIZE')
+
+  ret.add('--listing-cache', help='Enables the persistent cache of listings of remote folders, which is shared between commands (eg. by wildcards, pls and recursive operations). ' +
+    'A cached listing is reused, if the modification time and size of the folder didn\'t change, so an unchanged folder costs one stat instead of a whole listing. ' +
+    'Attributes of files modified in place by other clients may stay outdated.', action='store_true', env_var='RFSTOOLS_LISTING_CACHE')
+  ret.add('--listing-cache-file', help='The SQLite database of the listing cache. Defaults to ~/.cache/rfstools/listings.sqlite.', default=default_cache_path(), env_var='RFSTOOLS_LISTING_CACHE_FILE')
+  ret.add('--listing-cache-ttl', help='Time in seconds, for which a cached listing is trusted without the stat of the folder. Defaults to 0 (every reuse is validated).', type=float, default=0.0, env_var='RFSTOOLS_LISTING_CACHE_TTL')
+
+  ret.add('--resume', help='Enables resumable transfers. Files are transferred into partial files .NAME.part next to the destination, which are kept, when the transfer fails. ' +
+    'The next transfer to the same destination continues from the end of the partial file.', action='store_true', env_var='RFSTOOLS_RESUME')
+  ret.add('--resume-verify-size', help='Number of bytes at the end of a partial file, which are compared with the source before resuming. If they differ, the transfer starts from the beginning. ' +
+    'Defaults to 0 (no verification).', type=int, default=0, env_var='RFSTOOLS_RESUME_VERIFY_SIZE')
+
+  ret.add('--delta', help='Enables delta transfer of pushed files, which already exist on the remote storage. Only blocks missing in the remote version are sent. ' +
+    'It needs server side copy and random access writes (SFTP, FS), otherwise whole files are pushed. The compression ratio is printed in verbose mode.', action='store_true', env_var='RFSTOOLS_DELTA')
+  ret.add('--delta-block-size', help='Size of the blocks compared by the delta transfer in bytes. Defaults to 0, which chooses it by the size of the remote file.', type=int, default=0, env_var='RFSTOOLS_DELTA_BLOCK_SIZE')
+
+  ret.add('--wildcard-jobs', help='Number of remote folders listed at once while resolving wildcards (eg. with **). Every job opens its own connection. Defaults to 1.',
+    type=int, default=1, env_var='RFSTOOLS_WILDCARD_JOBS')
+  ret.add('--sort-wildcards', help='Sorts names in every remote folder while resolving wildcards, so the result doesn\'t depend on the order of listings. ' +
+    'By default, the order of listings is kept.', action='store_true', env_var='RFSTOOLS_SORT_WILDCARDS')
+
+  ret.add('--agent-socket', help='The Unix socket of rfsagent. If an agent listens on it, the connection is routed through the agent, which keeps it open for the next commands. ' +
+    'Not applicable for FS. An agent is used only, if the socket and its key (SOCKET.key) are private to the user. Defaults to $XDG_RUNTIME_DIR/rfsagent-UID.sock or $TMPDIR/rfsagent-UID/agent.sock.', default=default_socket_path(), env_var='RFSTOOLS_AGENT_SOCKET')
+  ret.add('--no-agent', help='Connects directly, even if rfsagent is running.', action='store_true', env_var='RFSTOOLS_NO_AGENT')
+
   ret.add('-x', '--transaction', help='Specifies the name of transaction in which the command should be executed. Not implemented yet.', env_var='RFSTOOLS_TRANSACTION')
 
   ret.add('-v', '--verbose', help='Enables verbose mode.', action='store_true', env_var='RFSTOOLS_VERBOSE')
   ret.add('-D', '--debug-mode', help='Enables debug mode. Implies verbose mode.', action='store_true', env_var='RFSTOOLS_DEBUG')
   ret.add('-L', '--log-file', help='Redirect all log messages to a file.', env_var='RFSTOOLS_LOG_FILE')
+  ret.add('--stats', dest='stats', action='store_const', const='text', env_var='RFSTOOLS_STATS',
+    help='Prints the numbers of calls, latencies and transferred bytes of every remote primitive operation (round trip) and of connecting to stderr at exit.')
+  ret.add('--stats=json', dest='stats', action='store_const', const='json', help='Prints the same totals as --stats as a JSON object.')
+  ret.add('--profile', metavar='OUT', env_var='RFSTOOLS_PROFILE',
+    help='Profiles the command and writes the profile as pstats into OUT and as collapsed stacks for flame graphs into OUT.collapsed at exit. ' +
+    'The sampling profiler pyinstrument is used, if it is installed, otherwise cProfile is used.')
+  ret.add('--trace', metavar='FILE', env_var='RFSTOOLS_TRACE',
+    help='Writes spans of all remote operations and primitive operations of the command into FILE at exit. The file is in the Chrome trace event format, which can be opened in Perfetto (ui.perfetto.dev).')
 
   ret.add('--no-host-key-checking', env_var='RFSTOOLS_NO_HOST_KEY_CHECKING', action='store_true', default=False,
           help='Disables host SSH key knowledge requirements policy. Be aware, that using this option makes you volnerable to MITM attack. Applicable only for SFTP.')
@@ -77,6 +115,20 @@ def default_arg_parser(description:str='', wildcard_skipper=False) -> configargp
 
   return ret
 
+def agent_arg_parser(description:str='') -> configargparse.ArgParser:
+  ret = configargparse.ArgParser(description=description, default_config_files=['/etc/rfstools.conf', '~/.rfstools.conf'], ignore_unknown_config_file_keys=True)
+  ret.add('-c', '--config-file', is_config_file=True, help='Configuration file path.', env_var='RFSTOOLS_CONFIG')
+
+  ret.add('--agent-socket', help='The Unix socket to listen on. The key, which authenticates the agent and its clients, is written into SOCKET.key. Defaults to $XDG_RUNTIME_DIR/rfsagent-UID.sock or $TMPDIR/rfsagent-UID/agent.sock.', default=default_socket_path(), env_var='RFSTOOLS_AGENT_SOCKET')
+  ret.add('--idle-timeout', help='Number of seconds, after which an unused connection is closed. Defaults to 600.', type=float, default=600, env_var='RFSTOOLS_AGENT_IDLE_TIMEOUT')
+  ret.add('--stop', help='Stops the agent listening on the socket.', action='store_true')
+
+  ret.add('-v', '--verbose', help='Enables verbose mode.', action='store_true', env_var='RFSTOOLS_VERBOSE')
+  ret.add('-D', '--debug-mode', help='Enables debug mode. Implies verbose mode.', action='store_true', env_var='RFSTOOLS_DEBUG')
+  ret.add('-L', '--log-file', help='Redirect all log messages to a file.', env_var='RFSTOOLS_LOG_FILE')
+
+  return ret
+
 def oneplus_arg_parser(description:str='', wildcard_skipper=False) -> configargparse.ArgParser:
   ret = default_arg_parser(description=description, wildcard_skipper=wildcard_skipper)
   ret.add('files', nargs="+", help='File(s) to process. It may contain wildcards. Files must start with prefix r: - no other files than remote are supported.', metavar='FILE(S)')
@@ -103,6 +155,21 @@ def many_to_one_arg_parser(description:str='') -> configargparse.ArgParser:
           help='Destination file to be transmited to. If there is more than one source file, the destination file must be a folder. Remote file must start with prefix r:',
           metavar='DESTINATION_FILE')
 
+  __add_transmission_options(ret)
+
+  return ret
+
+
+def batch_arg_parser(description:str='') -> configargparse.ArgParser:
+  ret = default_arg_parser(description=description, wildcard_skipper=True)
+  ret.add('batch_file', nargs='?', default='-', help='File with commands, one per line. Defaults to -, which reads them from the standard input.', metavar='BATCH_FILE')
+
+  __add_transmission_options(ret)
+
+  return ret
+
+
+def __add_transmission_options(ret):
   ret.add('-X', '--text-transmission', action='store_true', env_var="RFSTOOLS_TEXT_TRANSMISSION",
           help='Enable text transmission transformations to/from UTF8 and LF. ' +
                'Local files will be using this option always transformated to/from UTF8 and LF from/to remote encoding and remote line terminators. ' +
@@ -113,7 +180,3 @@ def many_to_one_arg_parser(description:str='') -> configargparse.ArgParser:
 
   ret.add('--local-crlf', action='store_true', help='Local system uses CRLF instead of LF.', env_var='RFSTOOLS_LOCAL_CRLF')
   ret.add('--local-encoding', default='UTF8', help='The encoding of the local system (eg. UTF8, UTF16). Defaults to UTF8.', env_var='RFSTOOLS_LOCAL_ENCODING')
-
-  return ret
-
-
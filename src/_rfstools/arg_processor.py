@@ -1,7 +1,8 @@
-from rfslib import pglobber, pinstance, path_utils, abstract_pconnection, pconnection_settings
+from rfslib import pinstance, path_utils, pconnection_settings
 import logging
 
 import os, sys
+import time
 
 import re
 
@@ -36,9 +37,42 @@ def __init_settings(args):
   settings.skip_validation = args['skip_validation']
   settings.text_transmission = args['text_transmission']
 
+  settings.metadata_cache = args['metadata_cache']
+  settings.metadata_cache_ttl = args['metadata_cache_ttl']
+  settings.metadata_cache_size = args['metadata_cache_size']
+
+  if args['listing_cache']:
+    settings.listing_cache_file = args['listing_cache_file']
+    settings.listing_cache_ttl = args['listing_cache_ttl']
+    settings.listing_cache_identity = __storage_identity(args)
+
+  settings.resume = args['resume']
+  settings.resume_verify_size = args['resume_verify_size']
+
+  settings.delta_transfer = args['delta']
+  settings.delta_block_size = args['delta_block_size']
+
+  if args['stats']:
+    from rfslib.pconnection_stats import PConnectionStats
+    settings.stats = PConnectionStats()
+
+  if args['trace']:
+    from rfslib.ptracing import PChromeTracer
+    settings.tracer = PChromeTracer()
+
   return settings
 
 
+# Identifies the remote storage in the listing cache.
+def __storage_identity(args):
+  c_type = args['connection_type']
+
+  if c_type == 'FS':
+    return c_type
+
+  return f"{c_type}://{args.get('username') or ''}@{args.get('host')}:{args.get('port') or ''}/{args.get('service_name') or ''}"
+
+
 def __autofill_missing_arguments(args):
   c_type = args["connection_type"]
 
@@ -92,11 +126,49 @@ def __validate_arguments(args):
 
 
 
+# Arguments used by connect. They identify connections kept by rfsagent.
+__connection_arg_names = ['connection_type', 'host', 'port', 'username', 'password', 'keyfile', 'no_host_key_checking', 'service_name',
+  'use_direct_tcp', 'use_ntlm_v1', 'no_dfs', 'disable_secure_negotiate', 'dfs_domain_controller', 'auth_protocol', 'enable_encryption', 'dont_require_signing',
+  'tls', 'passive_mode', 'connection_encoding', 'dont_use_list_a']
+
+
 def __init_connection(args):
-  c_type = args["connection_type"]
   settings = __init_settings(args)
 
-  
+  # FS has no session, which would be worth keeping.
+  if args['connection_type'] != "FS" and not args['no_agent'] and os.path.exists(args['agent_socket']):
+    from rfslib import agent_pconnection
+    import multiprocessing
+
+    connection_args = {name: args.get(name) for name in __connection_arg_names}
+
+    try:
+      connection = agent_pconnection.AgentPConnection(settings, args['agent_socket'], connection_args)
+      logging.info(f"Connected through rfsagent listening on {args['agent_socket']}.")
+      return connection
+
+    except ConnectionRefusedError:
+      logging.info(f"No rfsagent is listening on {args['agent_socket']}. Connecting directly.")
+
+    # The credentials aren't sent to a socket, which may belong to another user.
+    except (PermissionError, multiprocessing.AuthenticationError, FileNotFoundError, EOFError) as e:
+      logging.warning(f"rfsagent listening on {args['agent_socket']} can't be trusted. Connecting directly. ({type(e).__name__}: {e})")
+
+  return connect(args, settings)
+
+
+def connect(args, settings):
+  """Opens a new connection to the storage given by parsed command line arguments.
+
+     Args:
+       args: Dictionary of the arguments.
+       settings: Settings of the new connection.
+
+     Returns:
+       A new PConnection.
+  """
+  c_type = args["connection_type"]
+
   if c_type == "FS":
     logging.debug("Initiating FS (direct file system pseudo) connection.")
     from rfslib import fs_pconnection
@@ -169,12 +241,21 @@ def __init_connection(args):
   logging.debug("Connection successfully initiated.")
     
 
-def init(arg_parser, name, vars_to_pass):
-  p = arg_parser
+def init_agent(arg_parser, name):
+  """Parses arguments of rfsagent and sets up logging.
 
-  args = vars(p.parse_args())
-  ret = pinstance.PInstance()
-  
+     Returns:
+       Dictionary of the arguments.
+  """
+  args = vars(arg_parser.parse_args())
+
+  __init_logging(args, name)
+  logging.info(f"Starting rfstools version {sys.version}.")
+
+  return args
+
+
+def __init_logging(args, name):
   log_level = logging.WARNING
   if args["debug_mode"] == True:
     log_level = logging.DEBUG
@@ -193,6 +274,52 @@ def init(arg_parser, name, vars_to_pass):
 
   logging.basicConfig(format='%(asctime)s; {}; {}; %(message)s'.format(name, os.getpid()), level=log_level, **logging_config)
 
+
+# Finds the output of --profile in the command line or in the environment, so the profiler can be started before the arguments are parsed.
+def __early_profile(argv):
+  for i, arg in enumerate(argv):
+    if arg == '--':
+      break
+
+    if arg == '--profile' and i + 1 < len(argv):
+      return argv[i + 1]
+
+    if arg.startswith('--profile='):
+      return arg[len('--profile='):]
+
+  return os.environ.get('RFSTOOLS_PROFILE') or None
+
+def __start_profiler(ret, out):
+  from _rfstools.profiler import Profiler
+  ret.profiler = Profiler(out)
+  ret.profiler.start()
+
+def init(arg_parser, name, vars_to_pass):
+  p = arg_parser
+  ret = pinstance.PInstance()
+
+  # The profiler runs till the instance is closed, so parsing of the arguments and the imports made after it are profiled too. Only a profile given by a config file
+  # starts it after parsing. If the initialization fails, the instance is closed here, so the profile is written anyway.
+  profile = __early_profile(sys.argv[1:])
+  if profile:
+    __start_profiler(ret, profile)
+
+  try:
+    args = vars(p.parse_args())
+
+    if args['profile'] and ret.profiler is None:
+      __start_profiler(ret, args['profile'])
+
+    return __init_instance(ret, p, args, name, vars_to_pass)
+
+  except BaseException:
+    ret.close()
+    raise
+
+
+def __init_instance(ret, p, args, name, vars_to_pass):
+  __init_logging(args, name)
+
   logging.info(f"Starting rfstools version {sys.version}.")
   logging.info( __anonymize_formatted_values(p.format_values()) )
    
@@ -202,6 +329,18 @@ def init(arg_parser, name, vars_to_pass):
   logging.debug("Starting stage 1. (connection initialization)")
   ret.connection = __init_connection(args) 
 
+  # The stats are created by the settings right before connecting.
+  ret.stats = args['stats']
+  if ret.stats:
+    stats = ret.connection.get_settings().stats
+    stats.record('connect', time.monotonic() - stats.started)
+
+  # All spans of the command are children of the span of the command, which ends, when the instance is closed.
+  ret.trace = args['trace']
+  if ret.trace:
+    tracer = ret.connection.get_settings().tracer
+    ret.trace_span = tracer.start_span(name, {'argv': sys.argv[1:]})
+
   logging.debug("Starting stage 2. (path processing)")
 
   def pass_variable(var_name):
@@ -215,7 +354,8 @@ def init(arg_parser, name, vars_to_pass):
 
   ret.no_host_key_checking = args['no_host_key_checking']
   
-  glob = pglobber.PGlobber(ret.connection).glob
+  from rfslib import pglobber
+  glob = pglobber.PGlobber(ret.connection, jobs=args['wildcard_jobs'], sort=args['sort_wildcards']).glob
   
   def alter_path(path):
     if args["remote_only"] and not path_utils.is_remote(path):
@@ -274,8 +414,12 @@ def init(arg_parser, name, vars_to_pass):
   def process_single_path(path):
     p2 = alter_path(path)
 
-    return path_utils.GenericPath(path)
+    return path_utils.GenericPath(p2)
   
+  # Commands read later (eg. by pbatch) process their paths in the same way.
+  ret.process_paths = process_paths
+  ret.process_single_path = process_single_path
+
   if 'source_files' in args:
     ret.source_files = process_paths(args['source_files'])
 
@@ -0,0 +1,134 @@
+'''Profiling of whole commands enabled by --profile OUT. The main thread of the command is profiled from the start of arg_processor.init (before the arguments are parsed) till the instance is closed.
+The sampling profiler pyinstrument is used, when it is installed, otherwise the deterministic profiler cProfile is used. The profile is written as pstats into OUT
+(python -m pstats OUT, snakeviz OUT) and as collapsed stacks into OUT.collapsed (flamegraph.pl, speedscope, inferno). The weights of the collapsed stacks are microseconds.'''
+
+import importlib.util
+import os.path
+
+import logging
+
+
+# Formats a function as a frame of a collapsed stack. Semicolons separate the frames, so they can't be inside.
+def _frame_label(function, file, line):
+  if not file or file == '~':
+    label = function
+  else:
+    label = f"{function} ({os.path.basename(file)}:{line})"
+
+  return label.replace(';', ':')
+
+
+# Builds collapsed stacks from the call graph of pstats. cProfile records only pairs caller-callee, so the time of a function called from more stacks is split between them
+# in the proportions of the times spent in it by its callers. Stacks with less than a microsecond are dropped.
+def _collapsed_from_pstats(stats):
+  callees = {}
+  for function, (cc, nc, tt, ct, callers) in stats.items():
+    for caller, edge in callers.items():
+      callees.setdefault(caller, []).append((function, edge[3]))
+
+  ret = {}
+  stack = [((function,), 1.0) for function, value in stats.items() if not value[4]]
+
+  while stack:
+    path, share = stack.pop()
+    function = path[-1]
+    cc, nc, tt, ct, callers = stats[function]
+
+    self_us = tt * share * 1e6
+    if self_us >= 1:
+      key = ';'.join(_frame_label(f[2], f[0], f[1]) for f in path)
+      ret[key] = ret.get(key, 0) + self_us
+
+    for callee, edge_ct in callees.get(function, []):
+      callee_ct = stats[callee][3]
+
+      # Recursive calls are already counted in the time of the outer call.
+      if callee in path or callee_ct <= 0:
+        continue
+
+      callee_share = share * edge_ct / callee_ct
+      if callee_share * callee_ct * 1e6 >= 1:
+        stack.append((path + (callee,), callee_share))
+
+  return ret
+
+
+# Builds collapsed stacks from the frame tree of pyinstrument. Synthetic frames (eg. [self]) aren't frames of the stacks.
+def _collapsed_from_frames(root):
+  ret = {}
+  stack = [((), root)]
+
+  while stack:
+    path, frame = stack.pop()
+    path = path + (_frame_label(frame.function, frame.file_path, frame.line_no),)
+
+    children = [child for child in frame.children if not child.is_synthetic]
+    self_us = (frame.time - sum(child.time for child in children)) * 1e6
+
+    if self_us >= 1:
+      key = ';'.join(path)
+      ret[key] = ret.get(key, 0) + self_us
+
+    stack.extend((path, child) for child in children)
+
+  return ret
+
+
+class Profiler():
+  '''Profiler of a command, which writes pstats and collapsed stacks, when it is stopped.'''
+
+  def __init__(self, out: str, sampling: bool = None):
+    '''The constructor of Profiler.
+
+    Args:
+      out: Path of the written pstats file. The collapsed stacks are written into out.collapsed.
+      sampling: If True, pyinstrument is used, if False, cProfile is used. None chooses pyinstrument, if it is installed.
+    '''
+    self.__out = out
+
+    if sampling is None:
+      sampling = importlib.util.find_spec('pyinstrument') is not None
+
+    self.__sampling = sampling
+    self.__profiler = None
+
+  def start(self):
+    '''Starts profiling of the calling thread.'''
+    if self.__sampling:
+      from pyinstrument import Profiler as SamplingProfiler
+      self.__profiler = SamplingProfiler(interval=0.0005)
+      self.__profiler.start()
+    else:
+      import cProfile
+      self.__profiler = cProfile.Profile()
+      self.__profiler.enable()
+
+  def stop(self):
+    '''Stops profiling and writes the profile. It does nothing, if the profiler isn't running.'''
+    profiler, self.__profiler = self.__profiler, None
+    if profiler is None:
+      return
+
+    if self.__sampling:
+      profiler.stop()
+      from pyinstrument.renderers import PstatsRenderer
+
+      session = profiler.last_session
+      with open(self.__out, 'wb') as f:
+        f.write(PstatsRenderer().render(session).encode('utf-8', 'surrogateescape'))
+
+      root = session.root_frame()
+      collapsed = _collapsed_from_frames(root) if root is not None else {}
+
+    else:
+      profiler.disable()
+      import pstats
+
+      profiler.dump_stats(self.__out)
+      collapsed = _collapsed_from_pstats(pstats.Stats(profiler).stats)
+
+    with open(self.__out + '.collapsed', 'w') as f:
+      for key, us in sorted(collapsed.items()):
+        f.write(f"{key} {round(us)}\n")
+
+    logging.info(f"Profile written into {self.__out} and {self.__out}.collapsed by {'pyinstrument' if self.__sampling else 'cProfile'}.")
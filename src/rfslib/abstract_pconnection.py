@@ -1,16 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, Iterable, Iterator, List, Tuple
 
-import tempfile
 import os
 import os.path
 import shutil
+import stat
 import codecs
+import io
+import time
 
 from rfslib import pconnection_settings
 from rfslib.path_utils import path_normalize
+from rfslib.pmetadata_cache import PMetadataCache
 
-import random
 
 import logging, sys
 
@@ -19,6 +21,15 @@ re_public_var = re.compile(r'^[^_].*')
 #re_not_dot_dotdot = re.compile(r'^[^.][^.]*.*
 
 
+def _write_all(stream, data):
+  # Raw streams may write only a part of the data. (paramiko SFTPFile writes everything and returns None)
+  while data:
+    written = stream.write(data)
+    if written is None:
+      break
+    data = data[written:]
+
+
 class p_stat_result():
   '''Representation of the attributes of a file (or proxied file). It attemps to mirror the object returned by os.stat as closely as possible.'''
 
@@ -51,11 +62,11 @@ def _stat_unpack(pk_stat) -> p_stat_result:
 
     for alias in kw:
       if hasattr(pk_stat, alias):
-        exec(f'lstat.{default} = pk_stat.{alias}')
+        setattr(lstat, default, getattr(pk_stat, alias))
         return
     
     if default_value is not None:
-      exec(f'lstat.{default} = default_value')
+      setattr(lstat, default, default_value)
 
 
   aliases('st_mode', 'st_mode_smb12')
@@ -72,6 +83,76 @@ def _stat_unpack(pk_stat) -> p_stat_result:
   return stat
 
 
+_stat_field_names = ('st_mode', 'st_size', 'st_mtime', 'st_atime', 'st_uid', 'st_gid', 'st_nlink')
+
+
+def _stat_fields(pk_stat) -> dict:
+  '''Returns fields of an arbitrary stat object (as translated by _stat_unpack) as a dictionary, which can be stored (eg. in JSON). Returns None for None.
+  The precision of the modification time is kept, if the protocol reports it (eg. minutes over FTP).'''
+  if pk_stat is None:
+    return None
+
+  st = _stat_unpack(pk_stat)
+  ret = {name: getattr(st, name) for name in _stat_field_names}
+
+  if getattr(pk_stat, '_st_mtime_precision', None) is not None:
+    ret['_st_mtime_precision'] = pk_stat._st_mtime_precision
+
+  return ret
+
+
+def _stat_pack(fields: dict) -> p_stat_result:
+  '''Makes a p_stat_result from a dictionary returned by _stat_fields. Returns None for None.'''
+  if fields is None:
+    return None
+
+  st = p_stat_result()
+  for name, value in fields.items():
+    setattr(st, name, value)
+
+  return st
+
+
+class p_dir_entry():
+  '''Representation of an entry of a remote directory listing. It attempts to mirror the object returned by os.scandir as closely as possible.'''
+
+  def __init__(self, path: str, is_dir: bool, is_symlink: bool = False, lstat = None):
+    '''The constructor of p_dir_entry.
+
+    Args:
+      path: Remote path of the entry. (the listed directory joined with the entry name)
+      is_dir: True, if the entry is a directory or a symlink to a directory. The same as the result of _isdir.
+      is_symlink: True, if the entry is a symlink.
+      lstat: os.stat_result like object of the entry itself (not following symlinks) as returned together with the listing, or None, if the listing doesn't carry attributes.
+    '''
+    self.name = os.path.basename(path)
+    '''The entry's base filename.'''
+    self.path = path
+    '''The entry's full remote path.'''
+
+    self.__is_dir = is_dir
+    self.__is_symlink = is_symlink
+    self.__lstat = lstat
+
+  def is_dir(self) -> bool:
+    '''Returns True, if the entry is a directory or a symlink pointing to a directory.'''
+    return self.__is_dir
+
+  def is_symlink(self) -> bool:
+    '''Returns True, if the entry is a symlink.'''
+    return self.__is_symlink
+
+  def lstat(self) -> p_stat_result:
+    '''Returns attributes of the entry (not following symlinks) as carried by the listing or None, if the listing didn't carry them.'''
+    if self.__lstat is None:
+      return None
+
+    return _stat_unpack(self.__lstat)
+
+  def _raw_lstat(self):
+    return self.__lstat
+
+
 class PConnection(ABC):
   def set_settings(self, settings: pconnection_settings):
     '''The procedure sets all generic settings for PConnection.
@@ -85,6 +166,13 @@ class PConnection(ABC):
         logging.debug(f"Setting self.__{attr} to {getattr(settings, attr)}.")
         exec(f'self._PConnection__{attr} = settings.{attr}')
 
+    self.__metadata_cache_store = PMetadataCache(self.__metadata_cache_ttl, self.__metadata_cache_size)
+
+    if self.__listing_cache_file:
+      from rfslib.plisting_cache import PListingCache
+      self.__listing_cache_store = PListingCache(self.__listing_cache_file, self.__listing_cache_identity, self.__listing_cache_ttl)
+    else:
+      self.__listing_cache_store = None
 
 
   def get_settings(self) -> pconnection_settings:
@@ -109,6 +197,121 @@ class PConnection(ABC):
   def get_default_dmask(self) -> int:
     '''Returns default_dmask settings. For more details see pconnection_settings.'''
     return self.__default_dmask
+
+  def get_metadata_cache_hits(self) -> int:
+    '''Returns number of metadata lookups answered from the metadata cache. For more details see pconnection_settings.metadata_cache.'''
+    return self.__metadata_cache_store.hits
+
+  def get_metadata_cache_misses(self) -> int:
+    '''Returns number of metadata lookups, which missed the metadata cache. For more details see pconnection_settings.metadata_cache.'''
+    return self.__metadata_cache_store.misses
+
+  def clear_metadata_cache(self):
+    '''Drops all entries of the metadata cache. Useful, when the remote storage was modified by someone else.'''
+    self.__metadata_cache_store.clear()
+
+  def get_listing_cache_hits(self) -> int:
+    '''Returns number of listings answered from the persistent listing cache. For more details see pconnection_settings.listing_cache_file.'''
+    return self.__listing_cache_store.hits if self.__listing_cache_store is not None else 0
+
+  def get_listing_cache_misses(self) -> int:
+    '''Returns number of listings, which missed the persistent listing cache. For more details see pconnection_settings.listing_cache_file.'''
+    return self.__listing_cache_store.misses if self.__listing_cache_store is not None else 0
+
+  def clear_listing_cache(self):
+    '''Drops all listings of the remote storage from the persistent listing cache.'''
+    if self.__listing_cache_store is not None:
+      self.__listing_cache_store.clear()
+
+  # Protected lookups, whose results are held in the metadata cache.
+  __cached_primitives = ('_exists', '_lexists', '_isdir', '_stat', '_lstat')
+
+  # Protected primitives, which modify remote paths at given argument positions. The last item tells, whether the change can affect paths inside the given path too.
+  __invalidating_primitives = (
+    ('_mkdir', (0,), False), 
+    ('_unlink', (0,), False), 
+    ('_push', (1,), False), 
+    ('_server_copy', (1,), False), 
+    ('_rmdir', (0,), True), 
+    ('_rename', (0, 1), True))
+
+  def __install_metadata_cache(self):
+    def cached(name, primitive):
+      def wrapper(remote_path):
+        if not self.__metadata_cache:
+          return primitive(remote_path)
+
+        return self.__metadata_cache_store.lookup(name, remote_path, primitive)
+      return wrapper
+
+    def invalidating(primitive, positions, recursive):
+      def wrapper(*args):
+        try:
+          return primitive(*args)
+        finally:
+          if self.__metadata_cache:
+            for i in positions:
+              self.__metadata_cache_store.invalidate(args[i], recursive=recursive)
+
+          if self.__listing_cache_store is not None:
+            for i in positions:
+              self.__listing_cache_store.invalidate(args[i], recursive=recursive)
+      return wrapper
+
+    for name in self.__cached_primitives:
+      setattr(self, name, cached(name, getattr(self, name)))
+
+    for name, positions, recursive in self.__invalidating_primitives:
+      setattr(self, name, invalidating(getattr(self, name), positions, recursive))
+
+  # Protected primitives, whose calls are counted by pconnection_settings.stats and traced by pconnection_settings.tracer.
+  __counted_primitives = ('_stat', '_lstat', '_listdir', '_scandir', '_isdir', '_exists', '_lexists', '_push', '_pull', '_open', '_server_copy', '_copy_range',
+    '_rename', '_mkdir', '_rmdir', '_unlink')
+
+  # Public operations traced by pconnection_settings.tracer.
+  __traced_operations = ('push', 'rpush', 'pull', 'rpull', 'fcp', 'dcp', 'cp', 'fmv', 'dmv', 'mv', 'rm', 'mkdir', 'pmkdir', 'rmdir', 'rename', 'unlink', 'touch',
+    'listdir', 'find', 'ls', 'xls', 'stat', 'lstat', 'exists', 'lexists', 'isdir', 'clone')
+
+  # Numbers of bytes transferred by successful calls of the transfer methods. Parameters have the names of the parameters of the methods, so keyword arguments are passed too.
+  __transfer_sizes = {
+    '_push': lambda local_path, remote_path: os.path.getsize(local_path),
+    '_pull': lambda remote_path, local_path: os.path.getsize(local_path),
+    'push': lambda local_path, remote_path: os.path.getsize(local_path),
+    'pull': lambda remote_path, local_path: os.path.getsize(local_path),
+  }
+
+  # Returns a primitive, which makes the whole listing, when it is called, so its duration covers the round trips of the listing.
+  def __eager_primitive(self, name, primitive):
+    if name == '_scandir':
+      return lambda remote_path: list(primitive(remote_path))
+
+    return primitive
+
+  # Wraps the primitives by counters. They are installed under the caches, so only the calls, which reach the remote storage, are counted.
+  def __install_stats(self):
+    stats = self.__stats
+    if stats is None:
+      return
+
+    for name in self.__counted_primitives:
+      primitive = self.__eager_primitive(name, getattr(self, name))
+      setattr(self, name, stats.wrap(name, primitive, self.__transfer_sizes.get(name)))
+
+    self.clone = stats.wrap('clone', self.clone)
+
+  # Wraps the public operations and the primitives by spans of the tracer. Primitives are traced under the caches like by the stats.
+  def __install_tracer(self):
+    tracer = self.__tracer
+    if tracer is None:
+      return
+
+    import inspect
+
+    for name in self.__counted_primitives + self.__traced_operations:
+      method = getattr(self, name)
+      params = list(inspect.signature(method).parameters)
+
+      setattr(self, name, tracer.wrap(name, self.__eager_primitive(name, method), params, self.__transfer_sizes.get(name)))
  
 
   def __init__(self, settings: pconnection_settings):
@@ -127,6 +330,14 @@ class PConnection(ABC):
         raise AttributeError(f"Parameter settings argument doesn't have attribute {attr}")
 
     self.set_settings(settings)
+    self.__install_tracer()
+    self.__install_stats()
+    self.__install_metadata_cache()
+
+    # Set to False, when the first attempt of a server side copy reveals, that the remote storage doesn't support it.
+    self.__server_copy_supported = True
+    # Set to False, when the remote storage can't write to random positions of a file.
+    self.__delta_supported = True
     
 
   @abstractmethod
@@ -134,6 +345,15 @@ class PConnection(ABC):
     """Method to close the opened connection."""
     pass
 
+  @abstractmethod
+  def clone(self) -> 'PConnection':
+    """Method which opens a new connection with the same settings and connection arguments. The new connection is independently authenticated, so both connections can be used from different threads at once.
+
+    Returns:
+      A new opened connection of the same class.
+    """
+    pass
+
   @abstractmethod
   def _stat(self, remote_path: str) -> os.stat_result:
     """Protected method which returns statistics of a file (eg. size, last date modified,...) Follows symlinks to a destination file.
@@ -178,6 +398,22 @@ class PConnection(ABC):
     """
     pass
 
+  @abstractmethod
+  def _scandir(self, remote_path:str) -> Iterable[p_dir_entry]:
+    """Protected method which returns entries of a folder including hidden files together with their types and (if the protocol provides them in the listing) attributes. It might contain '.' and '..'.
+    It should cost only one round trip per folder. Additional requests are allowed only for entries, whose type can't be determined from the listing (eg. symlinks).
+    Undefined if the remote file doesn't exist or isn't a folder.
+
+    Args:
+      remote_path: The remote path of a remote folder.
+
+    Returns:
+      An iterable of p_dir_entry objects.
+      
+    :meta public: 
+    """
+    pass
+
   @abstractmethod
   def _rename(self, old_name:str, new_name:str):
     """Protected method which renames/moves a file. Behavior is undefined, if `new_name` file exists or `old_name` file doesn't exist.
@@ -215,6 +451,57 @@ class PConnection(ABC):
     """
     pass
   
+  @abstractmethod
+  def _open(self, remote_path:str, mode:str):
+    """Protected method which opens a nondirectory remote file for streaming in the binary form. Behavior is undefined if the file doesn't exist and mode is 'rb', if the destination folder doesn't exist or if the path is a directory.
+
+    Args:
+      remote_path: Path of a remote file to open.
+      mode: One of 'rb', 'wb', 'ab' or 'r+b'. Their meaning is the same as for the built-in open. Support of 'r+b' is optional - NotImplementedError is raised, if the remote storage can't write to random positions of an existing file.
+
+    Returns:
+      A binary file-like object with read or readinto, write, seek, tell and close methods. It may have seekable method too. In 'r+b' mode, it must have truncate method.
+      
+    :meta public: 
+    """
+    pass
+
+  def _server_copy(self, remote_path:str, new_remote_path:str):
+    """Protected method which copies a nondirectory file to another path on the remote storage without transferring the data through the local host. Behavior is undefined if destination folder or source file doesn't exist, source is directory or remote file already exists.
+
+    It raises NotImplementedError, if the remote storage can't copy files on its own. In that case, it is not called again for the connection and the files are copied through the local host. The default implementation always raises NotImplementedError.
+
+    Args:
+      remote_path: Path of a remote file to copy.
+      new_remote_path: Path on the remote storage, where to copy the file.
+      
+    :meta public: 
+    """
+    raise NotImplementedError("Server side copy is not supported.")
+
+  def _copy_range(self, src, src_offset:int, length:int, dst, dst_offset:int):
+    """Protected method which copies a range of bytes between two remote files. The default implementation reads the data to the local host and writes them back, backends override it, if the remote storage can copy the range itself.
+
+    Args:
+      src: A file opened by _open in 'rb' mode.
+      src_offset: Position of the range in src.
+      length: Number of bytes to copy. Behavior is undefined if src is shorter than src_offset + length.
+      dst: A file opened by _open in 'r+b' mode.
+      dst_offset: Position in dst, where to write the range.
+      
+    :meta public: 
+    """
+    src.seek(src_offset)
+    dst.seek(dst_offset)
+
+    while length > 0:
+      data = src.read(min(length, self.__open_buffer_size))
+      if not data:
+        raise EOFError(f"Unexpected end of the remote file while copying {length} more bytes.")
+
+      _write_all(dst, data)
+      length -= len(data)
+
   @abstractmethod
   def _isdir(self, remote_path:str) -> bool:
     """Protected method which checks, whether a remote file is a directory.
@@ -410,41 +697,86 @@ class PConnection(ABC):
     self.__check_link_existance(remote_path)
     return _stat_unpack( self._lstat(remote_path) )
 
-  def __encode(self, from_lpath, to_lpath):
-    if self.__text_transmission:
+  # Size of chunks, in which text transmission recodes files. Memory usage doesn't depend on the file size.
+  __transcoding_chunk_size = 1024 * 1024
 
-      with open(from_lpath, 'rb') as inp, open(to_lpath, 'wb') as out:
-        inp = inp.read()
-        decoded = codecs.decode(inp, encoding="utf8")
+  def __transcode(self, from_lpath, to_lpath, from_encoding, to_encoding, from_newline, to_newline):
+    decoder = codecs.getincrementaldecoder(from_encoding)()
+    encoder = codecs.getincrementalencoder(to_encoding)()
 
-        if self.__remote_crlf:
-          decoded = decoded.replace('\n', '\r\n')
-        
-        bout = codecs.encode(decoded, encoding=self.__remote_encoding)
-        out.write(bout)
+    with open(from_lpath, 'rb') as inp, open(to_lpath, 'wb') as out:
+      # The beginning of a line terminator, which might continue in the next chunk. (eg. CR of CRLF)
+      pending = ''
+
+      while True:
+        chunk = inp.read(self.__transcoding_chunk_size)
+        final = chunk == b''
+
+        text = pending + decoder.decode(chunk, final=final)
+        pending = ''
+
+        if from_newline != to_newline:
+          if not final and len(from_newline) > 1 and text.endswith(from_newline[0]):
+            pending = text[-1]
+            text = text[:-1]
+
+          text = text.replace(from_newline, to_newline)
+
+        out.write(encoder.encode(text, final=final))
+
+        if final:
+          break
+
+  def __encode(self, from_lpath, to_lpath):
+    if self.__text_transmission:
+      self.__transcode(from_lpath, to_lpath, "utf8", self.__remote_encoding, '\n', '\r\n' if self.__remote_crlf else '\n')
 
     else:
       shutil.copyfile(from_lpath, to_lpath)
 
   def __decode(self, from_lpath, to_lpath):
     if self.__text_transmission:
-      with open(from_lpath, 'rb') as inp, open(to_lpath, 'wb') as out:
-        binp = inp.read()
-        decoded = codecs.decode(binp, encoding=self.__remote_encoding)
+      self.__transcode(from_lpath, to_lpath, self.__remote_encoding, "utf8", '\r\n' if self.__remote_crlf else '\n', '\n')
 
-        if self.__remote_crlf:
-          decoded = decoded.replace('\r\n', '\n')
-        
-        bout = codecs.encode(decoded, encoding="utf8")
-        out.write(bout)
     else:
       shutil.copyfile(from_lpath, to_lpath)
 
   def __infolder_tmp_file(self, path):
+    import random
+
     dirname, basename = os.path.split(path)
     return os.path.join(dirname, '.' + basename + '.tmp' + str(random.randint(10000,65555)))
     
 
+  # Uploads a local file to a temporary file next to remote_path and returns its name.
+  def __push_tmp(self, local_path, remote_path):
+    if self.__resume:
+      from rfslib import presume
+
+      tmp_file = presume.partial_file(remote_path)
+      presume.push(self, local_path, tmp_file, self.__resume_verify_size, self.__open_buffer_size)
+
+    else:
+      tmp_file = self.__infolder_tmp_file(remote_path)
+      self._push(local_path, tmp_file)
+
+    return tmp_file
+
+  # Pushes a local file over its existing remote version by the rsync algorithm. Returns False, if the delta transfer isn't possible or worthwhile. The remote file is unchanged then.
+  def __delta_push(self, local_path, remote_path) -> bool:
+    if not (self.__delta_supported and self.__server_copy_supported) or not self._lexists(remote_path):
+      return False
+
+    from rfslib import premote_copy
+
+    try:
+      return premote_copy.delta_push(self, local_path, remote_path, self.__infolder_tmp_file(remote_path), self.__delta_block_size)
+
+    except NotImplementedError as e:
+      logging.info(f"Delta transfer is not available ({e}). Whole files will be pushed.")
+      self.__delta_supported = False
+      return False
+
   def push(self, local_path: str, remote_path: str):
     """Uploads/pushes a file from a local storage to a remote storage in the binary form.
 
@@ -463,14 +795,24 @@ class PConnection(ABC):
     self.__check_local_file_not_folder(local_path)
     self.__check_potencial_not_folder(remote_path)
 
-    with tempfile.NamedTemporaryFile() as _tmp_file:
-      tmp_file = _tmp_file.name
-    
-      self.__encode(local_path, tmp_file)
+    if self.__delta_transfer and not self.__text_transmission and self.__delta_push(local_path, remote_path):
+      logging.debug(f"Pushing local file {local_path} to the remote file {remote_path} is completed.")
+      return
 
-      tmp_file2 = self.__infolder_tmp_file(remote_path)
-      self._push(tmp_file, tmp_file2)
-      self.fmv(tmp_file2, remote_path)
+    if self.__text_transmission:
+      import tempfile
+
+      with tempfile.NamedTemporaryFile() as _tmp_file:
+        tmp_file = _tmp_file.name
+
+        self.__encode(local_path, tmp_file)
+        tmp_file2 = self.__push_tmp(tmp_file, remote_path)
+
+    else:
+      # Nothing to recode, so the local file is uploaded as it is without any local copy.
+      tmp_file2 = self.__push_tmp(local_path, remote_path)
+
+    self.fmv(tmp_file2, remote_path)
 
     logging.debug(f"Pushing local file {local_path} to the remote file {remote_path} is completed.")
 
@@ -487,8 +829,8 @@ class PConnection(ABC):
       if self.lexists(remote_path): 
         if not self.isdir(remote_path):
           raise InterruptedError(f"Cannot upload a folder {local_path} to a non-folder path {remote_path}.")
-        else:
-          self.mkdir(remote_path)
+      else:
+        self.mkdir(remote_path)
         
       for l_file in os.listdir(local_path):
         self.rpush(os.path.join(local_path, l_file), os.path.join(remote_path, l_file))
@@ -512,15 +854,41 @@ class PConnection(ABC):
     self.__check_not_folder(remote_path)
     self.__check_local_potencial_file_not_folder(local_path)
 
-    with tempfile.NamedTemporaryFile() as _tmp_file:
-      tmp_file = _tmp_file.name
-       
-      self._pull(remote_path, tmp_file)
+    tmp_file2 = self.__infolder_tmp_file(local_path)
+
+    try:
+      if self.__resume:
+        from rfslib import presume
+
+        # The partial file holds the data exactly as downloaded, so a failed pull can be resumed by the next one.
+        partial_file = presume.partial_file(local_path)
+        presume.pull(self, remote_path, partial_file, self.__resume_verify_size, self.__open_buffer_size)
+
+        if self.__text_transmission:
+          self.__decode(partial_file, tmp_file2)
+          os.unlink(partial_file)
+        else:
+          os.rename(partial_file, tmp_file2)
 
-      tmp_file2 = self.__infolder_tmp_file(local_path)
-      self.__decode(tmp_file, tmp_file2)
+      elif self.__text_transmission:
+        import tempfile
 
-      shutil.move(tmp_file2, local_path)
+        with tempfile.NamedTemporaryFile() as _tmp_file:
+          tmp_file = _tmp_file.name
+
+          self._pull(remote_path, tmp_file)
+          self.__decode(tmp_file, tmp_file2)
+
+      else:
+        # Nothing to recode, so the remote file is downloaded right next to its destination.
+        self._pull(remote_path, tmp_file2)
+
+    except BaseException:
+      if os.path.lexists(tmp_file2):
+        os.unlink(tmp_file2)
+      raise
+
+    shutil.move(tmp_file2, local_path)
 
     logging.debug(f"Pulling remote file {remote_path} to the local file {local_path} is completed.")
 
@@ -552,6 +920,80 @@ class PConnection(ABC):
       
     logging.debug(f"Recursive pulling of remote file {remote_path} to the local file {local_path} is completed.")
   
+  def __scandir(self, remote_path):
+    entries = self._scandir(remote_path) if self.__listing_cache_store is None else self.__cached_scandir(remote_path)
+
+    for entry in entries:
+      if entry.name == '.' or entry.name == '..':
+        continue
+
+      if self.__metadata_cache:
+        self.__prime_metadata_cache(entry)
+
+      yield entry
+
+  # Returns entries of a folder from the persistent listing cache. If there is no valid cached listing, the folder is listed and the listing is stored.
+  def __cached_scandir(self, remote_path):
+    store = self.__listing_cache_store
+    folder_stat = []
+
+    # The stat is taken before the listing, so a change made during the listing makes the stored listing outdated.
+    def get_folder_stat():
+      if not folder_stat:
+        folder_stat.append(_stat_pack(_stat_fields(self._stat(remote_path))))
+      return folder_stat[0]
+
+    try:
+      cached = store.lookup(remote_path, get_folder_stat)
+      st = get_folder_stat() if cached is None else None
+
+    # Some protocols can't stat some folders (eg. the root folder over FTP). Their listings aren't cached.
+    except Exception as e:
+      logging.debug(f"Remote folder {remote_path} can't be validated, so its listing isn't cached. ({e})")
+      return self._scandir(remote_path)
+
+    if cached is not None:
+      logging.debug(f"Listing of remote folder {remote_path} is taken from the listing cache.")
+      return [p_dir_entry(os.path.join(remote_path, name), is_dir, is_symlink, _stat_pack(attributes)) for name, is_dir, is_symlink, attributes in cached]
+
+    entries = [entry for entry in self._scandir(remote_path) if entry.name != '.' and entry.name != '..']
+
+    store.put(remote_path, st, [(entry.name, entry.is_dir(), entry.is_symlink(), _stat_fields(entry._raw_lstat())) for entry in entries])
+    return entries
+
+  def __prime_metadata_cache(self, entry):
+    store = self.__metadata_cache_store
+
+    store.put('_lexists', entry.path, True)
+    store.put('_isdir', entry.path, entry.is_dir())
+
+    if not entry.is_symlink() or entry.is_dir():
+      store.put('_exists', entry.path, True)
+
+    if entry._raw_lstat() is not None:
+      store.put('_lstat', entry.path, entry._raw_lstat())
+
+  def scandir(self, remote_path: str, is_dir: bool = False) -> Iterable[p_dir_entry]:
+    '''
+    Public method which returns entries of a folder including hidden files together with their types and attributes. It never returns '.' or '..'.
+    Whole listing costs (with exception of symlinks) only one round trip.
+
+    Args:
+      remote_path: The remote path of a remote folder.
+      is_dir: True, if the remote path is already known to be a folder (eg. from an entry of the listing of its parent). Checks of its existence and type, which cost round trips, are skipped then.
+
+    Returns:
+      An iterator of p_dir_entry objects. If the protocol doesn't provide attributes of files in the listing, their lstat method returns None.
+
+    '''
+    logging.debug(f"Scanning directory file {remote_path}.")
+
+    remote_path = path_normalize(remote_path)
+    if not is_dir:
+      self.__check_is_folder(remote_path)
+
+    return self.__scandir(remote_path)
+
   def listdir(self, remote_path: str):
     '''
     Public method which returns a list of files in the folder including hidden files. It never returns '.' or '..'.
@@ -565,22 +1007,13 @@ class PConnection(ABC):
     '''
     logging.debug(f"Listing file {remote_path}.")
 
-    remote_path = path_normalize(remote_path)
-    self.__check_is_folder(remote_path)
-    
-    raw_list = self._listdir(remote_path)
-    
-    ret = []
-    for el in raw_list:
-      if (not el == '.') and (not el == '..'):
-        ret.append(el)
-
-    return ret
+    return [entry.name for entry in self.scandir(remote_path)]
 
 
   def find(self, remote_path: str, child_first: bool = False) -> List[str]:
     '''
     A public method which returns DFS (depth-first search) of remote_path including hidden files. It never returns '.' or '..'.
+    Symlinks are returned, but they aren't followed.
 
     Args:
       child_first: If True, childs of a directory will be returned before the directory itself.
@@ -591,22 +1024,49 @@ class PConnection(ABC):
     '''
     logging.debug(f"Finding (making a tree) of file {remote_path}.")
 
+    from rfslib import pwalk
+
     remote_path = path_normalize(remote_path)
-    self.__check_file_existance(remote_path)
+    self.__check_link_existance(remote_path)
 
-    if self._isdir(remote_path):
-      ret = []
-      for f in self.xls(remote_path):
-        if not child_first:
-          ret.append(remote_path)
+    if not pwalk.is_walkable(self, remote_path):
+      return [remote_path]
 
-        ret.extend( dfs_find(self, f) )
+    ret = []
+    for dirpath, dirs, nondirs in pwalk.walk(self.__scandir, remote_path, not child_first, None):
+      if not child_first:
+        ret.append(dirpath)
 
-        if child_first:
-          ret.append(remote_path)
-        
-    else:
-      return [remote_path]
+      ret.extend(entry.path for entry in nondirs)
+
+      if child_first:
+        ret.append(dirpath)
+
+    return ret
+
+  def walk(self, remote_path: str, top_down: bool = True, onerror: Callable[[OSError], None] = None) -> Iterator[Tuple[str, List[p_dir_entry], List[p_dir_entry]]]:
+    '''
+    A public method, which walks the tree of a remote folder like os.walk including hidden files. Every folder is listed once by a typed listing (scandir), so the walk costs one round trip per folder
+    and types and attributes of the files are taken from the listings. The walk is iterative, so the depth of the tree isn't limited by the recursion limit of Python,
+    and only the listings of the folders on the current path are held in memory.
+
+    Args:
+      remote_path: The remote path of a remote folder.
+      top_down: If True, a folder is yielded before its subfolders and the subfolders removed from its list dirs (eg. by del dirs[i]) aren't walked. Otherwise a folder is yielded after all its subfolders.
+      onerror: A function called with the OSError raised by listing of a folder. The folder is skipped then. If None, the error is raised.
+
+    Yields:
+      Tuples (dirpath, dirs, nondirs), where dirpath is the remote path of a folder, dirs is a list of p_dir_entry objects of its subfolders and nondirs is a list of p_dir_entry objects of its other files.
+      Symlinks to folders are in nondirs and they aren't followed.
+    '''
+    logging.debug(f"Walking the tree of remote folder {remote_path} (top_down={top_down}).")
+
+    from rfslib import pwalk
+
+    remote_path = path_normalize(remote_path)
+    self.__check_is_folder(remote_path)
+
+    return pwalk.walk(self.__scandir, remote_path, top_down, onerror)
 
   def mkdir(self, remote_path: str):
     '''
@@ -698,30 +1158,34 @@ class PConnection(ABC):
     for name in old_names:
       self.__check_file_existance(name)   
 
-    target_dir_ls = self.ls(target_dir)
+    self.__dmv([(name, self._isdir(name)) for name in old_names], target_dir)
 
-    for name in old_names:
+    logging.debug(f"Moving remote files {old_names} inside a remote directory {target_dir} is completed.")
+
+  # Moves sources given as (path, is directory) pairs inside target_dir
+  def __dmv(self, sources, target_dir):
+    target_dir_types = {entry.name: entry.is_dir() for entry in self.__scandir(target_dir)}
+
+    for name, name_isdir in sources:
       dirname, basename = os.path.split(name)
       newname = os.path.join(target_dir, basename)
 
-      if self.isdir(name):
-        if basename in target_dir_ls:
-          if not self.isdir(newname):
+      if name_isdir:
+        if basename in target_dir_types:
+          if not target_dir_types[basename]:
             raise InterruptedError(f"Cannot overwrite remote non-directory {newname} with remote directory {name}.")
-          self.dmv(self.xls(name), newname)
+          self.__dmv([(entry.path, entry.is_dir()) for entry in self.__scandir(name)], newname)
 
         else:
           self.rename(name, newname)          
      
       else:
-        if basename in target_dir_ls:
-          if self.isdir(newname):
+        if basename in target_dir_types:
+          if target_dir_types[basename]:
             raise InterruptedError(f"Cannot overwrite remote directory {newname} with remote non-directory {name}.")
         
         self.fmv(name, newname)
 
-    logging.debug(f"Moving remote files {old_names} inside a remote directory {new_name} is completed.")
-
 
   def mv(self, old_names: List[str], new_name: str):
     logging.debug(f"Moving remote file {old_names} to a remote destination {new_name}.")
@@ -750,18 +1214,36 @@ class PConnection(ABC):
     logging.debug(f"Copying remote non-directory file {old_name} to a remote non-directory file {new_name}.")
 
     self.__check_not_folder(old_name)
-    self.__check_potencial_not_folder(old_name)
-    
-    with tempfile.NamedTemporaryFile() as _tmp_file:
-      tmp_file = _tmp_file.name
-      self.pull(old_name, tmp_file)
+    self.__check_potencial_not_folder(new_name)
+
+    # The data go through the local host only, when the remote storage can't copy the file itself.
+    if not (self.__server_copy_supported and self.__server_fcp(old_name, new_name)):
+      import tempfile
+
+      with tempfile.NamedTemporaryFile() as _tmp_file:
+        tmp_file = _tmp_file.name
+        self.pull(old_name, tmp_file)
     
-      if self.exists(new_name):
-        self.rm(new_name)
-      self.push(tmp_file, new_name)
+        if self.exists(new_name):
+          self.rm(new_name)
+        self.push(tmp_file, new_name)
 
     logging.debug(f"Copying remote non-directory file {old_name} to a remote non-directory file {new_name} is completed.")
 
+  # Returns False, if the remote storage can't copy the file itself.
+  def __server_fcp(self, old_name, new_name) -> bool:
+    from rfslib import premote_copy
+
+    try:
+      premote_copy.server_copy(self, old_name, new_name, self.__infolder_tmp_file(new_name))
+
+    except NotImplementedError as e:
+      logging.info(f"Server side copy is not available ({e}). Remote files will be copied through the local host.")
+      self.__server_copy_supported = False
+      return False
+
+    return True
+
   def dcp(self, old_names: List[str], target_dir: str, recursive: bool = False):
     logging.debug(f"Copying remote file {old_names} inside a remote directory {target_dir}. (recursive={recursive})")
 
@@ -775,36 +1257,44 @@ class PConnection(ABC):
       else:
         self.__check_file_existance(name)   
     
-    target_dir_ls = self.ls(target_dir)
+    self.__dcp([(name, recursive and self._isdir(name)) for name in old_names], target_dir, recursive)
 
+    logging.debug(f"Copying remote file {old_names} inside a remote directory {target_dir} is completed. (recursive={recursive})")
 
-    for name in old_names:
+
+
+  # Copies sources given as (path, is directory) pairs inside target_dir
+  def __dcp(self, sources, target_dir, recursive, target_dir_new = False):
+    target_dir_types = {}
+    if not target_dir_new:
+      target_dir_types = {entry.name: entry.is_dir() for entry in self.__scandir(target_dir)}
+
+    for name, name_isdir in sources:
       dirname, basename = os.path.split(name)
       newname = os.path.join(target_dir, basename)
 
       logging.debug(f"New name of remote file {name} will be {newname}.")
 
-      if recursive and self.isdir(name):
-        if basename in target_dir_ls:
-          if not self.isdir(newname):
+      if recursive and name_isdir:
+        newname_new = False
+
+        if basename in target_dir_types:
+          if not target_dir_types[basename]:
             raise InterruptedError(f"Cannot overwrite remote non-directory {newname} with remote directory {name}.")
 
         else:
           self.mkdir(newname)   
+          newname_new = True
        
-        self.dcp(self.xls(name), newname)
+        self.__dcp([(entry.path, entry.is_dir()) for entry in self.__scandir(name)], newname, recursive, newname_new)
      
       else:
-        if basename in target_dir_ls:
-          if self.isdir(newname):
+        if basename in target_dir_types:
+          if target_dir_types[basename]:
             raise InterruptedError(f"Cannot overwrite remote directory {newname} with remote non-directory {name}.")
         
         self.fcp(name, newname)
 
-    logging.debug(f"Copying remote file {old_names} inside a remote directory {target_dir} is completed. (recursive={recursive})")
-
-
-
   def cp(self, old_names: List[str], new_name: str, recursive: bool = False):
     logging.debug(f"Copying remote files {old_names} to destination {new_name} (recursive={recursive}).")
 
@@ -854,7 +1344,21 @@ class PConnection(ABC):
     logging.debug(f"Remote file {remote_path} is a directory: {ret}") 
     return ret    
 
-  def rm(self, remote_path: str, recursive: bool = False):
+  def rm(self, remote_path: str, recursive: bool = False, jobs: int = 1) -> Tuple[int, int]:
+    '''
+    A public method, which deletes a nondirectory file or, if recursive, a whole tree. Symlinks are deleted, but they aren't followed.
+
+    Every folder of a tree is listed once by a bottom-up walk. Its files are unlinked without any further checks and the folder is removed, as soon as its files and subfolders are removed,
+    without listing it again. With more jobs, files are unlinked and folders removed by a pool of cloned connections, while the main connection walks the tree.
+
+    Args:
+      remote_path: The remote path of a file or a tree to delete.
+      recursive: If True, folders are deleted with their contents.
+      jobs: Number of files and folders deleted at once. With more than one job, every job deletes files over its own clone of the connection.
+
+    Returns:
+      A pair (number of deleted nondirectory files, number of deleted folders).
+    '''
     logging.debug(f"Deleting remote non-directory file {remote_path} (recursive={recursive}).")     
 
     remote_path = path_normalize(remote_path)
@@ -862,16 +1366,29 @@ class PConnection(ABC):
 
     if not recursive:
       self.unlink(remote_path)
+      ret = 1, 0
     
     else:
-      for f in self.find(remote_path, child_first=True):
-        if self.isdir(f):
-          self.rmdir(f)
-        else: 
-          self.unlink(f)
+      start = time.monotonic()
+      ret = self.__rm_tree(remote_path, jobs)
+      duration = max(time.monotonic() - start, 1e-9)
+
+      logging.info(f"Deleted {ret[0]} files and {ret[1]} folders of remote tree {remote_path} in {duration:.3f} s ({sum(ret) / duration:.1f} deletions/s).")
 
     logging.debug(f"Deleting remote non-directory file {remote_path} is completed (recursive={recursive}).")     
-       
+    return ret
+
+  # Deletes a tree and returns numbers of deleted files and folders.
+  def __rm_tree(self, remote_path, jobs):
+    from rfslib import pwalk
+
+    try:
+      return pwalk.rm_tree(self, self.__scandir, remote_path, jobs)
+
+    finally:
+      # The clones don't invalidate the metadata cache of this connection.
+      if jobs > 1:
+        self.__metadata_cache_store.invalidate(remote_path, recursive=True)
 
   def ls(self, remote_path: str):
     logging.debug(f"Listing remote directory file {remote_path}.")     
@@ -881,8 +1398,8 @@ class PConnection(ABC):
     
     ret = []
     
-    if self.isdir(remote_path):
-      ret = self.listdir(remote_path)
+    if self._isdir(remote_path):
+      ret = [entry.name for entry in self.__scandir(remote_path)]
     else:
       ret = [os.path.basename(remote_path)]
 
@@ -893,15 +1410,66 @@ class PConnection(ABC):
   def xls(self, remote_path: str):
     remote_path = path_normalize(remote_path)
 
-    def prepend_d(lfile):
-      return os.path.join(remote_path, lfile)
-
     if self.isdir(remote_path):
-      return [*map(prepend_d, self.ls(remote_path))]
+      return [entry.path for entry in self.__scandir(remote_path)]
     else: 
       return [remote_path]
 
+  # Size of the buffer of files opened by open with the default buffering. A remote request is much more expensive than a local syscall.
+  __open_buffer_size = 1024 * 1024
+
+  def open(self, remote_path: str, mode: str = 'rb', buffering: int = -1):
+    """Opens a remote file for streaming binary access, so it can be read or written without staging it on the local disk. The data are never recoded - text_transmission doesn't apply.
+
+    Args:
+      remote_path: Path of a remote file to open.
+      mode: 'rb' for reading, 'wb' for writing (the file is created or truncated) or 'ab' for appending.
+      buffering: 0 disables buffering, positive value is the size of the buffer in bytes. Defaults to -1, which means buffer of 1 MiB.
+
+    Returns:
+      io.BufferedReader (mode 'rb') or io.BufferedWriter over a PRawFile object, or the PRawFile object itself, if buffering is 0.
+    """
+    logging.debug(f"Opening remote file {remote_path} in mode {mode}.")
+
+    remote_path = path_normalize(remote_path)
+
+    if mode not in ('rb', 'wb', 'ab'):
+      raise ValueError(f"Invalid mode {mode}. Only 'rb', 'wb' and 'ab' are supported.")
+
+    if mode == 'rb':
+      self.__check_not_folder(remote_path)
+      on_close = None
+
+    else:
+      self.__check_potencial_not_folder(remote_path)
+
+      # The file is changed by the time of closing, so it is dropped from the caches once more then. The listing of its parent may miss it or hold its old attributes.
+      def on_close():
+        if self.__metadata_cache:
+          self.__metadata_cache_store.invalidate(remote_path)
+
+        if self.__listing_cache_store is not None:
+          self.__listing_cache_store.invalidate(remote_path)
+
+      on_close()
+
+    from rfslib.pfile import PRawFile
+    raw = PRawFile(self._open(remote_path, mode), remote_path, mode, on_close)
+
+    if buffering == 0:
+      return raw
+
+    if buffering < 0:
+      buffering = self.__open_buffer_size
+
+    if mode == 'rb':
+      return io.BufferedReader(raw, buffering)
+    else:
+      return io.BufferedWriter(raw, buffering)
+
   def touch(self, remote_path: str):
+    import tempfile
+
     with tempfile.NamedTemporaryFile() as _tmp_file:
       tmp_file = _tmp_file.name
       self.push(tmp_file, remote_path)    
@@ -0,0 +1,132 @@
+from rfslib import abstract_pconnection, pconnection_settings, pagent
+
+import os.path
+
+
+class _agent_file():
+  '''A file opened by _open on the agent side.'''
+
+  def __init__(self, call, handle):
+    self.__call = call
+    self.handle = handle
+    '''Identifier of the file in the agent.'''
+
+  def read(self, size=-1):
+    return self.__call('file', self.handle, 'read', (size,))
+
+  def write(self, data):
+    return self.__call('file', self.handle, 'write', (bytes(data),))
+
+  def seek(self, offset, whence=0):
+    return self.__call('file', self.handle, 'seek', (offset, whence))
+
+  def tell(self):
+    return self.__call('file', self.handle, 'tell', ())
+
+  def truncate(self, size=None):
+    return self.__call('file', self.handle, 'truncate', (size,))
+
+  def seekable(self):
+    return self.__call('file', self.handle, 'seekable', ())
+
+  def close(self):
+    if self.handle is not None:
+      self.__call('file', self.handle, 'close', ())
+      self.handle = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+
+class AgentPConnection(abstract_pconnection.PConnection):
+  '''Class for a connection routed through an rfsagent (see rfslib.pagent). The agent holds the real connection, so the handshake and authentication are done once per agent, not once per command.
+  Public interface with an exception of __init__ and close is inherited from PConnection.'''
+
+  def __init__(self, settings: pconnection_settings, socket_path: str, connection_args: dict):
+    '''The constructor of AgentPConnection.
+
+    Args:
+      settings: The settings for super class PConnection. They are applied by this process, the agent only calls the protected methods of its connection.
+      socket_path: Path of the Unix socket of the agent.
+      connection_args: Arguments, which identify the remote storage and its credentials. The agent opens a connection with them, if it doesn't have an idle one.
+    '''
+    super().__init__(settings)
+
+    self.__connection_args = {'socket_path': socket_path, 'connection_args': connection_args}
+    self.__client = pagent.connect_agent(socket_path)
+
+    try:
+      self.__call('connect', connection_args)
+    except BaseException:
+      self.__client.close()
+      raise
+
+  def __call(self, *request):
+    self.__client.send(request)
+    status, value = self.__client.recv()
+
+    if status == 'error':
+      raise value
+
+    return value
+
+  def __primitive(self, name, *args):
+    return self.__call('call', name, args)
+
+  def close(self):
+    self.__client.close()
+
+  def clone(self):
+    return AgentPConnection(self.get_settings(), **self.__connection_args)
+
+  def _listdir(self, remote_path):
+    return self.__primitive('_listdir', remote_path)
+
+  def _scandir(self, remote_path):
+    return iter(self.__primitive('_scandir', remote_path))
+
+  def _rename(self, old_name, new_name):
+    self.__primitive('_rename', old_name, new_name)
+
+  # The agent has another working directory, so local paths are made absolute.
+  def _push(self, local_path, remote_path):
+    self.__primitive('_push', os.path.abspath(local_path), remote_path)
+
+  def _pull(self, remote_path, local_path):
+    self.__primitive('_pull', remote_path, os.path.abspath(local_path))
+
+  def _open(self, remote_path, mode):
+    return _agent_file(self.__call, self.__primitive('_open', remote_path, mode))
+
+  def _server_copy(self, remote_path, new_remote_path):
+    self.__primitive('_server_copy', remote_path, new_remote_path)
+
+  def _copy_range(self, src, src_offset, length, dst, dst_offset):
+    self.__primitive('_copy_range', src.handle, src_offset, length, dst.handle, dst_offset)
+
+  def _isdir(self, remote_path):
+    return self.__primitive('_isdir', remote_path)
+
+  def _mkdir(self, remote_path):
+    self.__primitive('_mkdir', remote_path)
+
+  def _rmdir(self, remote_path):
+    self.__primitive('_rmdir', remote_path)
+
+  def _unlink(self, remote_path):
+    self.__primitive('_unlink', remote_path)
+
+  def _exists(self, remote_path):
+    return self.__primitive('_exists', remote_path)
+
+  def _lexists(self, remote_path):
+    return self.__primitive('_lexists', remote_path)
+
+  def _stat(self, remote_path):
+    return self.__primitive('_stat', remote_path)
+
+  def _lstat(self, remote_path):
+    return self.__primitive('_lstat', remote_path)
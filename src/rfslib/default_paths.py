@@ -0,0 +1,20 @@
+'''Default paths of files shared by commands (the socket of rfsagent and the database of the listing cache). The module imports only os, so the defaults of command line options
+can be computed without importing the modules, which use the files.'''
+
+import os
+
+
+def default_socket_path() -> str:
+  '''Returns the default path of the agent socket. It is placed in XDG_RUNTIME_DIR, or in the private folder rfsagent-UID in TMPDIR (/tmp by default), if it isn't set.'''
+  runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+  if runtime_dir:
+    return os.path.join(runtime_dir, f'rfsagent-{os.getuid()}.sock')
+
+  # The default is computed by every command, so tempfile (which imports random) isn't imported for it. Unix sockets are only on POSIX systems, where the temporary folder is TMPDIR or /tmp.
+  return os.path.join(os.environ.get('TMPDIR') or '/tmp', f'rfsagent-{os.getuid()}', 'agent.sock')
+
+
+def default_cache_path() -> str:
+  '''Returns the default path of the listing cache database. It is placed in XDG_CACHE_HOME/rfstools, or in ~/.cache/rfstools, if XDG_CACHE_HOME isn't set.'''
+  cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(cache_dir, 'rfstools', 'listings.sqlite')
@@ -1,6 +1,7 @@
 from rfslib import abstract_pconnection, pconnection_settings
 
 import os, sys, shutil
+import errno
 
 class FsPConnection(abstract_pconnection.PConnection):
   '''Class for operating with local filesystem. Public interface with an exception of __init__ and close is inherited from PConnection.'''
@@ -13,12 +14,24 @@ class FsPConnection(abstract_pconnection.PConnection):
     '''
     super().__init__(settings)
 
+    # copy_file_range is available on Linux only.
+    self.__copy_file_range = hasattr(os, 'copy_file_range')
+
   def close(self):
     pass
+
+  def clone(self):
+    return FsPConnection(self.get_settings())
   
   def _listdir(self, remote_path):
     return os.listdir(remote_path)
 
+  def _scandir(self, remote_path):
+    with os.scandir(remote_path) as it:
+      for entry in it:
+        yield abstract_pconnection.p_dir_entry(os.path.join(remote_path, entry.name), 
+          entry.is_dir(), entry.is_symlink(), entry.stat(follow_symlinks=False))
+
   def _rename(self, old_name, new_name):
     os.rename(old_name, new_name) 
 
@@ -27,6 +40,58 @@ class FsPConnection(abstract_pconnection.PConnection):
 
   def _pull(self, remote_path, local_path):
     shutil.copy(remote_path, local_path)
+
+  def _open(self, remote_path, mode):
+    return open(remote_path, mode, buffering=0)
+
+  def _server_copy(self, remote_path, new_remote_path):
+    if self.__copy_file_range and self.__copy_in_kernel(remote_path, new_remote_path):
+      shutil.copymode(remote_path, new_remote_path)
+    else:
+      shutil.copy(remote_path, new_remote_path)
+
+  def _copy_range(self, src, src_offset, length, dst, dst_offset):
+    while self.__copy_file_range and length > 0:
+      try:
+        copied = os.copy_file_range(src.fileno(), dst.fileno(), length, src_offset, dst_offset)
+
+      except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+          raise
+        break
+
+      if copied == 0:
+        raise EOFError(f"Unexpected end of the file while copying {length} more bytes.")
+
+      src_offset += copied
+      dst_offset += copied
+      length -= copied
+
+    if length > 0:
+      super()._copy_range(src, src_offset, length, dst, dst_offset)
+
+  # Copies the file by copy_file_range, which lets the filesystem make a reflink or an in-kernel copy. 
+  # Returns False, if the filesystem can't do it for the given files.
+  def __copy_in_kernel(self, remote_path, new_remote_path) -> bool:
+    with open(remote_path, 'rb') as src, open(new_remote_path, 'wb') as dst:
+      offset = 0
+
+      while True:
+        try:
+          copied = os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30)
+
+        except OSError as e:
+          if offset != 0 or e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise
+
+          # Crossing filesystems (EXDEV) or an unsupported file type (EINVAL) are per file, missing syscall isn't.
+          if e.errno in (errno.ENOSYS, errno.EOPNOTSUPP):
+            self.__copy_file_range = False
+          return False
+
+        if copied == 0:
+          return True
+        offset += copied
   
   def _isdir(self, remote_path):
     return os.path.isdir(remote_path)
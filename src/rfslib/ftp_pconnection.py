@@ -3,6 +3,69 @@ import ftplib
 import ftputil
 
 from os.path import split
+from stat import S_ISDIR, S_ISLNK
+import posixpath
+import io
+
+class _ftp_file():
+  '''Binary file on a FTP server. Every (re)opening is a new data transfer. A file opened for reading is seekable - a seek just restarts the transfer from the new position by the REST command.'''
+
+  def __init__(self, ftp, path, mode):
+    self.__ftp = ftp
+    self.__path = path
+    self.__mode = mode
+
+    self.__file = None
+    self.__position = 0
+
+    if mode == 'ab':
+      # ftputil doesn't support the append mode, so the file is overwritten from its end.
+      self.__ftp.stat_cache.invalidate(path)
+      if self.__ftp.path.exists(path):
+        self.__position = self.__ftp.path.getsize(path)
+
+    if mode != 'rb':
+      self.__file = self.__ftp.open(path, 'wb', rest=self.__position or None)
+
+  def seekable(self):
+    return self.__mode == 'rb'
+
+  def read(self, size=-1):
+    if self.__file is None:
+      self.__file = self.__ftp.open(self.__path, 'rb', rest=self.__position or None)
+
+    data = self.__file.read(size)
+    self.__position += len(data)
+    return data
+
+  def write(self, data):
+    self.__file.write(data)
+    self.__position += len(data)
+    return len(data)
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_CUR:
+      offset += self.__position
+    elif whence == io.SEEK_END:
+      offset += self.__ftp.path.getsize(self.__path)
+
+    if offset < 0:
+      raise ValueError(f"Negative seek position {offset}.")
+
+    if offset != self.__position:
+      self.close()
+      self.__position = offset
+
+    return self.__position
+
+  def tell(self):
+    return self.__position
+
+  def close(self):
+    if self.__file is not None:
+      self.__file.close()
+      self.__file = None
+
 
 class FtpPConnection(abstract_pconnection.PConnection):
   '''Class for FTP connection. Public interface with an exception of __init__ and close is inherited from PConnection.'''
@@ -25,6 +88,9 @@ class FtpPConnection(abstract_pconnection.PConnection):
     '''
     super().__init__(settings)
 
+    self.__connection_args = dict(host=host, username=username, password=password, port=port, tls=tls, passive_mode=passive_mode, 
+      debug_level=debug_level, connection_encoding=connection_encoding, dont_use_list_a=dont_use_list_a)
+
     if tls:
       factory_b_class = ftplib.FTP_TLS
     else:
@@ -44,10 +110,25 @@ class FtpPConnection(abstract_pconnection.PConnection):
 
   def close(self):
     self.__ftp.close()
+
+  def clone(self):
+    return FtpPConnection(self.get_settings(), **self.__connection_args)
   
   def _listdir(self, remote_path):
     return self.__ftp.listdir(remote_path)
 
+  def _scandir(self, remote_path):
+    for name in self.__ftp.listdir(remote_path):
+      path = posixpath.join(remote_path, name)
+
+      # The stat result is taken from the ftputil cache, which was filled by the LIST command above.
+      attr = self.__ftp.lstat(path)
+
+      if attr.st_mode is None or S_ISLNK(attr.st_mode):
+        yield abstract_pconnection.p_dir_entry(path, self._isdir(path), attr.st_mode is not None, attr)
+      else:
+        yield abstract_pconnection.p_dir_entry(path, S_ISDIR(attr.st_mode), False, attr)
+
   def _rename(self, old_name, new_name):
     self.__ftp.rename(old_name, new_name) 
 
@@ -57,6 +138,12 @@ class FtpPConnection(abstract_pconnection.PConnection):
   def _pull(self, remote_path, local_path):
     self.__ftp.download(remote_path, local_path)
   
+  def _open(self, remote_path, mode):
+    if mode == 'r+b':
+      raise NotImplementedError("Random access writes are not supported.")
+
+    return _ftp_file(self.__ftp, remote_path, mode)
+
   def _isdir(self, remote_path):
     return self.__ftp.path.isdir(remote_path)
   
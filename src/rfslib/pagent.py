@@ -0,0 +1,320 @@
+'''Agent, which keeps authenticated connections to remote storages alive between commands, similar to OpenSSH ControlMaster.
+Clients (AgentPConnection) talk to it over a Unix socket, which is private to the user, and both sides authenticate each other by a random key stored next to the socket. Every client gets its own connection for the time of its session. When the session ends, the connection is kept idle for the next client with the same connection arguments.'''
+
+import threading
+import socket
+import stat
+import time
+import json
+import os
+
+import logging
+
+from rfslib.default_paths import default_socket_path
+
+
+# Protected PConnection methods, which can be called by clients.
+_primitives = {'_stat', '_lstat', '_listdir', '_scandir', '_rename', '_push', '_pull', '_open', '_server_copy', '_copy_range',
+  '_isdir', '_mkdir', '_rmdir', '_unlink', '_exists', '_lexists'}
+
+# Methods of files opened by _open, which can be called by clients.
+_file_methods = {'read', 'write', 'seek', 'tell', 'truncate', 'seekable', 'close'}
+
+
+def _key_path(socket_path):
+  return socket_path + '.key'
+
+
+# Checks, that a file can't be replaced or read by other users - it is owned by the current user, isn't accessible by others and its folder is writable only by its owner
+# (the current user or root) or it is sticky (eg. /tmp), so other users can't replace the file.
+def _check_private(path):
+  st = os.lstat(path)
+  if st.st_uid != os.getuid() or st.st_mode & 0o077:
+    raise PermissionError(f"{path} isn't private to the current user (owner {st.st_uid}, mode {stat.S_IMODE(st.st_mode):o}).")
+
+  folder = os.path.dirname(os.path.abspath(path))
+  st = os.stat(folder)
+  if st.st_uid not in (os.getuid(), 0) or (st.st_mode & 0o022 and not st.st_mode & stat.S_ISVTX):
+    raise PermissionError(f"Folder {folder} of {path} can be modified by other users.")
+
+
+def connect_agent(socket_path: str):
+  '''Connects to the agent listening on the given socket. The socket and the key of the agent are checked to be private to the current user and the agent is authenticated by the key,
+  before anything is sent to it.
+
+  Returns:
+    A multiprocessing.connection.Connection to the agent.
+
+  Raises:
+    PermissionError: The socket or the key can be accessed by other users.
+    multiprocessing.AuthenticationError: The agent doesn't know the key.
+  '''
+  from multiprocessing.connection import Client
+
+  _check_private(socket_path)
+  _check_private(_key_path(socket_path))
+
+  with open(_key_path(socket_path), 'rb') as f:
+    authkey = f.read()
+
+  return Client(socket_path, family='AF_UNIX', authkey=authkey)
+
+
+def stop_agent(socket_path: str):
+  '''Asks the agent listening on the given socket to stop. Idle connections are closed, active sessions are finished first.'''
+  client = connect_agent(socket_path)
+
+  try:
+    client.send(('stop',))
+    client.recv()
+
+  finally:
+    client.close()
+
+
+class _agent_session():
+  '''A connected client. It holds one connection checked out of the pool and files opened by the client.'''
+
+  def __init__(self):
+    self.key = None
+    self.connection = None
+    self.files = {}
+    self.broken = False
+
+
+class PAgent():
+  '''Server of the agent. Connections are pooled by their connection arguments and closed after idle_timeout seconds without a client.'''
+
+  def __init__(self, socket_path: str, connect, idle_timeout: float = 600):
+    '''The constructor of PAgent.
+
+    Args:
+      socket_path: Path of the Unix socket to listen on. Only the owner can connect to it. The key authenticating the agent and its clients is stored in socket_path.key.
+      connect: Function, which opens a new PConnection for a dictionary of connection arguments sent by a client.
+      idle_timeout: Number of seconds, after which an unused connection is closed.
+    '''
+    self.__socket_path = socket_path
+    self.__connect = connect
+    self.__idle_timeout = idle_timeout
+
+    # Idle connections by the keys of their connection arguments - lists of (connection, time of the last use) pairs.
+    self.__idle = {}
+    self.__lock = threading.Lock()
+
+    self.__listener = None
+    self.__stopping = threading.Event()
+
+  def serve(self):
+    '''Accepts clients, till the agent is stopped by stop or by a client.'''
+    from multiprocessing.connection import Listener
+    from multiprocessing import AuthenticationError
+
+    folder = os.path.dirname(os.path.abspath(self.__socket_path))
+    os.makedirs(folder, mode=0o700, exist_ok=True)
+
+    # A socket left by a killed agent is replaced.
+    if os.path.exists(self.__socket_path):
+      probe = socket.socket(socket.AF_UNIX)
+      try:
+        probe.connect(self.__socket_path)
+        raise FileExistsError(f"Another agent is listening on {self.__socket_path}.")
+      except ConnectionRefusedError:
+        os.unlink(self.__socket_path)
+      finally:
+        probe.close()
+
+    # Clients authenticate the agent by the key before they send any credentials and the agent accepts only clients, which know it.
+    authkey = os.urandom(32)
+    key_path = _key_path(self.__socket_path)
+
+    if os.path.lexists(key_path):
+      os.unlink(key_path)
+
+    with os.fdopen(os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+      f.write(authkey)
+
+    umask = os.umask(0o177)
+    try:
+      self.__listener = Listener(self.__socket_path, family='AF_UNIX', authkey=authkey)
+    finally:
+      os.umask(umask)
+
+    _check_private(self.__socket_path)
+    logging.info(f"Agent is listening on {self.__socket_path}.")
+
+    janitor = threading.Thread(target=self.__expire_idle, daemon=True)
+    janitor.start()
+
+    try:
+      while not self.__stopping.is_set():
+        try:
+          client = self.__listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+          # The agent is stopped (the connection of stop fails to authenticate).
+          if self.__stopping.is_set():
+            break
+
+          logging.warning(f"A client failed to authenticate. ({type(e).__name__}: {e})")
+          continue
+
+        threading.Thread(target=self.__serve_client, args=(client,), daemon=True).start()
+
+    finally:
+      self.__stopping.set()
+      self.__listener.close()
+      self.__close_idle(lambda used: True)
+
+      if os.path.lexists(key_path):
+        os.unlink(key_path)
+
+      logging.info("Agent is stopped.")
+
+  def stop(self):
+    '''Stops accepting clients and closes idle connections.'''
+    self.__stopping.set()
+
+    # Closing of the listener doesn't wake a blocked accept, so the agent connects to itself. The listener is closed by serve.
+    if self.__listener is not None:
+      probe = socket.socket(socket.AF_UNIX)
+      try:
+        probe.connect(self.__socket_path)
+      except OSError:
+        pass
+      finally:
+        probe.close()
+
+  def __checkout(self, args):
+    key = json.dumps(args, sort_keys=True)
+
+    with self.__lock:
+      idle = self.__idle.get(key)
+      if idle:
+        connection, _ = idle.pop()
+        logging.debug(f"Reusing an idle connection for {args.get('connection_type')} {args.get('host')}.")
+        return key, connection
+
+    logging.info(f"Opening a new connection to {args.get('connection_type')} {args.get('host')}.")
+    return key, self.__connect(args)
+
+  def __checkin(self, session):
+    if session.connection is None:
+      return
+
+    if session.broken or self.__stopping.is_set():
+      session.connection.close()
+      return
+
+    with self.__lock:
+      self.__idle.setdefault(session.key, []).append((session.connection, time.monotonic()))
+
+  def __close_idle(self, expired):
+    with self.__lock:
+      closing = []
+
+      for key, idle in self.__idle.items():
+        closing.extend(connection for connection, used in idle if expired(used))
+        idle[:] = [(connection, used) for connection, used in idle if not expired(used)]
+
+    for connection in closing:
+      try:
+        connection.close()
+      except Exception:
+        logging.exception("Closing of an idle connection failed.")
+
+  def __expire_idle(self):
+    while not self.__stopping.wait(min(self.__idle_timeout, 10)):
+      deadline = time.monotonic() - self.__idle_timeout
+      self.__close_idle(lambda used: used < deadline)
+
+  def __serve_client(self, client):
+    session = _agent_session()
+
+    try:
+      while True:
+        try:
+          request = client.recv()
+        except EOFError:
+          break
+
+        if request[0] == 'stop':
+          client.send(('ok', None))
+          self.stop()
+          break
+
+        try:
+          value = self.__handle(session, request)
+          response = ('ok', value)
+
+        except Exception as e:
+          # Errors of the storage (eg. missing files) don't break the connection, others may.
+          if not isinstance(e, OSError) or isinstance(e, ConnectionError):
+            session.broken = True
+          response = ('error', e)
+
+        try:
+          client.send(response)
+        except Exception:
+          client.send(('error', IOError(f"{type(response[1]).__name__}: {response[1]}")))
+
+    except Exception:
+      logging.exception("Session of a client failed.")
+      session.broken = True
+
+    finally:
+      for f in session.files.values():
+        try:
+          f.close()
+        except Exception:
+          session.broken = True
+
+      self.__checkin(session)
+      client.close()
+
+  def __handle(self, session, request):
+    kind = request[0]
+
+    if kind == 'connect':
+      if session.connection is not None:
+        raise ValueError("The session is already connected.")
+
+      session.key, session.connection = self.__checkout(request[1])
+      return None
+
+    if session.connection is None:
+      raise ValueError("The session isn't connected.")
+
+    if kind == 'call':
+      _, name, args = request
+      if name not in _primitives:
+        raise ValueError(f"Method {name} can't be called through the agent.")
+
+      if name == '_open':
+        f = session.connection._open(*args)
+        handle = id(f)
+        session.files[handle] = f
+        return handle
+
+      if name == '_copy_range':
+        src, src_offset, length, dst, dst_offset = args
+        return session.connection._copy_range(session.files[src], src_offset, length, session.files[dst], dst_offset)
+
+      if name == '_scandir':
+        return list(session.connection._scandir(*args))
+
+      return getattr(session.connection, name)(*args)
+
+    if kind == 'file':
+      _, handle, name, args = request
+      if name not in _file_methods:
+        raise ValueError(f"File method {name} can't be called through the agent.")
+
+      f = session.files[handle]
+
+      if name == 'close':
+        del session.files[handle]
+      elif name == 'seekable' and not hasattr(f, 'seekable'):
+        return True
+
+      return getattr(f, name)(*args)
+
+    raise ValueError(f"Unknown request {kind}.")
@@ -5,6 +5,7 @@ import shutil
 import logging
 
 
+
 __remote_path_re = re.compile(r'^r:')
 
 def is_remote(path):
@@ -55,24 +56,41 @@ def _split_list_local_remote(gpaths):
 
   return (local, remote)
 
-def generic_cp(conn, sources, dest, recursive=False):
-  logging.debug(f"Starting generic_cp. (recursive={recursive})")
+def generic_cp(conn, sources, dest, recursive=False, jobs=1):
+  logging.debug(f"Starting generic_cp. (recursive={recursive}, jobs={jobs})")
+
+  if jobs > 1:
+    from rfslib.ptransfer import PTransferEngine
+    engine = PTransferEngine(conn, jobs)
+
+    try:
+      _generic_cp(conn, sources, dest, recursive,
+        push = lambda l, r: engine.push(l, r, recursive=recursive),
+        pull = lambda r, l: engine.pull(r, l, recursive=recursive))
+    finally:
+      failures = engine.close()
+
+    if failures != []:
+      raise InterruptedError(f"{len(failures)} file transfer(s) failed.")
+
+  elif recursive:
+    _generic_cp(conn, sources, dest, recursive, push=conn.rpush, pull=conn.rpull)
+
+  else:
+    _generic_cp(conn, sources, dest, recursive, push=conn.push, pull=conn.pull)
+
+  logging.debug("generic_cp: done")
+
 
+def _generic_cp(conn, sources, dest, recursive, push, pull):
   sources = map(generic_path_normalize, sources)
   dest = generic_path_normalize(dest)
 
   local_src_paths, remote_src_paths = _split_list_local_remote(sources)
   
-  push, pull, lcopy = None, None, None
   if recursive:
-    push = conn.rpush
-    pull = conn.rpull
-
     lcopy = shutil.copytree
   else:
-    push = conn.push
-    pull = conn.pull
-    
     lcopy = shutil.copy
 
   if dest.remote:
@@ -111,8 +129,6 @@ def generic_cp(conn, sources, dest, recursive=False):
         pull(r_file, os.path.join(dest.path, r_basename))
       else:
         pull(r_file, dest.path)
-
-  logging.debug("generic_cp: done")
     
 
 def generic_mv(conn, sources, dest):
@@ -168,7 +184,7 @@ def generic_mv(conn, sources, dest):
     for r_file in remote_src_paths:
       if dest_dir:
         r_dirname, r_basename = os.path.split(r_file)
-        conn.rpull(r_file, os.path.join(dest.path, l_basename))
+        conn.rpull(r_file, os.path.join(dest.path, r_basename))
       else:
         conn.rpull(r_file, dest.path)
       
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+import contextvars
+import threading
+
+import logging
+
+
+class PConnectionPool():
+  '''Pool of worker threads, each of them owning its own clone of a PConnection. It is used to run independent remote operations in parallel.
+  The original connection is never used by the workers, so the caller can keep using it from its own thread.'''
+
+  def __init__(self, connection, size: int):
+    '''The constructor of PConnectionPool. Connections are cloned lazily, when a worker thread runs its first task.
+
+    Args:
+      connection: The PConnection to be cloned.
+      size: Number of worker threads (and connections).
+    '''
+    self.__connection = connection
+    self.__size = size
+
+    self.__local = threading.local()
+    self.__clones = []
+    self.__clones_lock = threading.Lock()
+
+    self.__executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='rfstools-worker')
+
+    # Bounds number of scheduled tasks, so huge trees don't make a huge queue.
+    self.__pending = threading.BoundedSemaphore(4 * size)
+
+  def get_size(self) -> int:
+    '''Returns number of worker threads of the pool.'''
+    return self.__size
+
+  def connection(self):
+    '''Returns the connection owned by the calling worker thread. It is cloned on the first call.'''
+    connection = getattr(self.__local, 'connection', None)
+
+    if connection is None:
+      logging.debug(f"Cloning a connection for worker {threading.current_thread().name}.")
+      connection = self.__connection.clone()
+      self.__local.connection = connection
+
+      with self.__clones_lock:
+        self.__clones.append(connection)
+
+    return connection
+
+  def submit(self, function, *args) -> Future:
+    '''Schedules function(connection, *args) to be run by a worker thread with its own connection in a copy of the context (contextvars) of the caller. Blocks, if too many tasks are already waiting.
+
+    Returns:
+      A concurrent.futures.Future of the function result.
+    '''
+    self.__pending.acquire()
+
+    def task():
+      try:
+        return function(self.connection(), *args)
+      finally:
+        self.__pending.release()
+
+    # The task runs in the context of the caller, so eg. spans of tracing started by the task are children of the caller's span.
+    return self.__executor.submit(contextvars.copy_context().run, task)
+
+  def close(self):
+    '''Waits for all scheduled tasks and closes all cloned connections.'''
+    self.__executor.shutdown(wait=True)
+
+    with self.__clones_lock:
+      for connection in self.__clones:
+        connection.close()
+      self.__clones = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
@@ -28,4 +28,33 @@ class pconnection_settings():
   default_dmask:int = 0o0022
   '''If mode (permissions) of a directory can't be fetched, this value will be used instead of it.'''
 
+  metadata_cache:bool = False
+  '''If True, results of exists, lexists, isdir, stat and lstat lookups (including the negative ones) are cached per connection. Cached entries of a path and its parent directory are dropped, when the connection modifies the path. Changes made by other clients may stay unnoticed until the entry expires.'''
+  metadata_cache_ttl:float = 5.0
+  '''Time in seconds, after which a cached metadata entry expires.'''
+  metadata_cache_size:int = 4096
+  '''Maximal number of paths held in the metadata cache. The least recently used paths are evicted first.'''
 
+  listing_cache_file:str = None
+  '''Path of an SQLite database, which persistently caches listings of remote folders between commands. None disables the cache. A cached listing is reused, if a stat of the folder returns the same modification time and size as when it was listed,
+  so an unchanged folder costs one stat instead of a whole listing. Listings are dropped, when the connection modifies the folder. Attributes of files modified in place by other clients (which doesn't change the folder) may stay outdated.'''
+  listing_cache_ttl:float = 0.0
+  '''Time in seconds, for which a cached listing is trusted without the stat of the folder. 0 means, that every reuse is validated by the stat.'''
+  listing_cache_identity:str = ''
+  '''Identity of the remote storage (eg. connection type, user, host and port), which separates listings of different storages in one database.'''
+
+  stats:object = None
+  '''A PConnectionStats object, which counts and times calls of protected primitives (round trips) and bytes transferred by them. It is shared with clones of the connection, so it holds the totals. None disables the counting. It is applied, when the connection is created.'''
+
+  tracer:object = None
+  '''A PTracer object (see rfslib.ptracing), which receives spans of public operations and protected primitives of the connection. It is shared with clones of the connection. None disables the tracing. It is applied, when the connection is created.'''
+
+  resume:bool = False
+  '''If True, push and pull write into partial files with deterministic names (.NAME.part) next to the destination and keep them, when the transfer fails. The next transfer to the same destination continues from the end of the partial file instead of starting from the beginning.'''
+  resume_verify_size:int = 0
+  '''Number of bytes at the end of a partial file, which are compared with the source before the transfer is resumed. If they differ, the transfer starts from the beginning. 0 disables the verification.'''
+
+  delta_transfer:bool = False
+  '''If True, push of a file, which already exists on the remote storage, sends only blocks missing in the remote version (rsync algorithm). The remote version is read to find the blocks, copied on the server to a temporary file and the temporary file is patched. It is used only, if the remote storage supports server side copy and random access writes (SFTP, FS) and if text transmission is off. Otherwise the whole file is pushed.'''
+  delta_block_size:int = 0
+  '''Size of the blocks compared by the delta transfer in bytes. 0 chooses it by the size of the remote version (square root of the size bounded by 2 KiB and 128 KiB).'''
@@ -0,0 +1,142 @@
+'''Counters and latency histograms of calls of protected primitives of PConnection (eg. _lexists, _listdir, _push), which tell, where the time of a slow command goes.
+A call of a protected primitive is a round trip to the remote storage for most connection types, so the counters are not affected by the metadata cache or the listing cache,
+which answer lookups without calling the primitives. Connecting (handshakes) and cloning of connections (eg. by pools of jobs) are recorded as pseudo primitives 'connect' and 'clone'.'''
+
+import json
+import threading
+import time
+
+
+_histogram_bounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+'''Upper bounds of buckets of the latency histograms in seconds. The last bucket holds the slower calls.'''
+
+
+def _bucket_label(i):
+  if i == len(_histogram_bounds):
+    return f">{_histogram_bounds[-1] * 1000:g}ms"
+
+  return f"<={_histogram_bounds[i] * 1000:g}ms"
+
+
+class _primitive_stats():
+  def __init__(self):
+    self.calls = 0
+    self.errors = 0
+    self.seconds = 0.0
+    self.max_seconds = 0.0
+    self.bytes = 0
+    self.histogram = [0] * (len(_histogram_bounds) + 1)
+
+  # Estimates a quantile of the latency by the upper bound of the bucket, where it falls.
+  def quantile(self, q):
+    rank = q * self.calls
+    seen = 0
+
+    for i, count in enumerate(self.histogram):
+      seen += count
+
+      if seen >= rank and count:
+        return min(_histogram_bounds[i], self.max_seconds) if i < len(_histogram_bounds) else self.max_seconds
+
+    return self.max_seconds
+
+
+class PConnectionStats():
+  '''Thread-safe counters of calls of protected primitives. One object is shared by a connection and all its clones, so it holds the totals of a whole command.
+  Enabled by pconnection_settings.stats.'''
+
+  def __init__(self):
+    '''The constructor of PConnectionStats.'''
+    self.__lock = threading.Lock()
+    self.__primitives = {}
+
+    self.started = time.monotonic()
+    '''Monotonic time of the creation of the object, from which the elapsed time of the report is measured.'''
+
+  def record(self, name: str, seconds: float, error: bool = False, size: int = 0):
+    '''Records a call of a primitive.
+
+    Args:
+      name: Name of the primitive. (eg. '_push')
+      seconds: Duration of the call.
+      error: True, if the call raised an exception.
+      size: Number of transferred bytes.
+    '''
+    bucket = 0
+    while bucket < len(_histogram_bounds) and seconds > _histogram_bounds[bucket]:
+      bucket += 1
+
+    with self.__lock:
+      s = self.__primitives.get(name)
+      if s is None:
+        s = self.__primitives[name] = _primitive_stats()
+
+      s.calls += 1
+      s.errors += error
+      s.seconds += seconds
+      s.max_seconds = max(s.max_seconds, seconds)
+      s.bytes += size
+      s.histogram[bucket] += 1
+
+  def wrap(self, name: str, primitive, size=None):
+    '''Returns a function, which calls primitive and records the call.
+
+    Args:
+      name: Name of the primitive.
+      primitive: The wrapped function.
+      size: A function, which gets the arguments of a successful call (with the same names) and returns the number of transferred bytes. (eg. size of the pushed file)
+    '''
+    def wrapper(*args, **kwargs):
+      start = time.perf_counter()
+
+      try:
+        ret = primitive(*args, **kwargs)
+      except BaseException:
+        self.record(name, time.perf_counter() - start, error=True)
+        raise
+
+      self.record(name, time.perf_counter() - start, size=size(*args, **kwargs) if size is not None else 0)
+      return ret
+
+    return wrapper
+
+  def totals(self) -> dict:
+    '''Returns a dictionary, which maps names of the called primitives to dictionaries of their totals (calls, errors, seconds, mean_ms, p50_ms, p99_ms, max_ms, bytes and histogram).
+    Quantiles are estimated by the upper bounds of the buckets of the histogram.'''
+    with self.__lock:
+      ret = {}
+
+      for name, s in sorted(self.__primitives.items()):
+        ret[name] = {
+          'calls': s.calls,
+          'errors': s.errors,
+          'seconds': s.seconds,
+          'mean_ms': 1000 * s.seconds / s.calls,
+          'p50_ms': 1000 * s.quantile(0.5),
+          'p99_ms': 1000 * s.quantile(0.99),
+          'max_ms': 1000 * s.max_seconds,
+          'bytes': s.bytes,
+          'histogram': {_bucket_label(i): count for i, count in enumerate(s.histogram) if count},
+        }
+
+      return ret
+
+  def report(self, format: str = 'text') -> str:
+    '''Returns the totals formatted as a table ('text') or as a JSON object ('json'), which contains the elapsed time and the totals of every primitive.'''
+    elapsed = time.monotonic() - self.started
+    totals = self.totals()
+
+    if format == 'json':
+      return json.dumps({'elapsed_seconds': elapsed, 'primitives': totals})
+
+    lines = [f"{'primitive':14} {'calls':>8} {'errors':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'bytes':>14}"]
+
+    for name, t in totals.items():
+      lines.append(f"{name:14} {t['calls']:8} {t['errors']:7} {t['seconds']:9.3f} {t['mean_ms']:9.3f} {t['p50_ms']:9.3f} {t['p99_ms']:9.3f} {t['max_ms']:9.3f} {t['bytes']:14}")
+
+    calls = sum(t['calls'] for t in totals.values())
+    seconds = sum(t['seconds'] for t in totals.values())
+    lines.append(f"{'total':14} {calls:8} {sum(t['errors'] for t in totals.values()):7} {seconds:9.3f} {'':9} {'':9} {'':9} {'':9} {sum(t['bytes'] for t in totals.values()):14}")
+    lines.append(f"Elapsed {elapsed:.3f} s, {seconds:.3f} s in primitives.")
+
+    return '\n'.join(lines)
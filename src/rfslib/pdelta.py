@@ -0,0 +1,131 @@
+'''Block delta algorithm of rsync. A new version of a file is described by copies of blocks of an old version (the basis) and literal data.
+Blocks of the basis are found by a rolling weak checksum (Adler-32) in every position of the new file and confirmed by a strong hash.'''
+
+import hashlib
+import math
+import zlib
+
+
+_adler_modulus = 65521
+
+# The new file is read in chunks of this size.
+_read_size = 4 * 1024 * 1024
+
+# Literal data are yielded in pieces of at most this size, so the memory usage is bounded.
+_max_literal_size = 1024 * 1024
+
+
+def block_size(basis_size: int) -> int:
+  '''Returns block size suitable for a basis of the given size. Like in rsync, it is square root of the size bounded by 2 KiB and 128 KiB.'''
+  size = int(math.sqrt(basis_size)) & ~7
+  return min(max(size, 2048), 128 * 1024)
+
+
+def _strong(block) -> bytes:
+  return hashlib.md5(block).digest()
+
+
+def signatures(basis, block_size: int) -> dict:
+  '''Computes signatures of all whole blocks of the basis.
+
+  Args:
+    basis: Binary file-like object of the basis opened for reading.
+    block_size: Size of the blocks.
+
+  Returns:
+    A dictionary weak checksum -> {strong hash -> offset of the block in the basis}.
+  '''
+  ret = {}
+  offset = 0
+
+  while True:
+    block = basis.read(block_size)
+    if len(block) < block_size:
+      break
+
+    ret.setdefault(zlib.adler32(block), {}).setdefault(_strong(block), offset)
+    offset += block_size
+
+  return ret
+
+
+def delta(source, signatures: dict, block_size: int):
+  '''Describes the source by the blocks of the basis.
+
+  Args:
+    source: Binary file-like object of the new file opened for reading.
+    signatures: Signatures of the basis returned by the function signatures.
+    block_size: Size of the blocks, the same as used for the signatures.
+
+  Returns:
+    A generator of instructions, which build the source in order. An instruction is either an integer (copy of the block of the basis at the given offset) or bytes (literal data).
+  '''
+  buffer = b''
+  eof = False
+
+  # Positions in the buffer - start of the current window and start of the pending literal data.
+  position = 0
+  literal = 0
+
+  weak = None
+
+  while True:
+    if len(buffer) - position <= block_size and not eof:
+      buffer = buffer[literal:]
+      position -= literal
+      literal = 0
+
+      chunk = source.read(_read_size)
+      eof = chunk == b''
+      buffer += chunk
+      continue
+
+    if len(buffer) - position < block_size:
+      break
+
+    if weak is None:
+      weak = zlib.adler32(buffer[position:position + block_size])
+
+    hit = signatures.get(weak)
+    if hit is not None:
+      offset = hit.get(_strong(buffer[position:position + block_size]))
+
+      if offset is not None:
+        if literal < position:
+          yield buffer[literal:position]
+
+        yield offset
+
+        position += block_size
+        literal = position
+        weak = None
+        continue
+
+    if len(buffer) - position == block_size:
+      # The window can't roll further, till more data are read.
+      if eof:
+        break
+      continue
+
+    # Rolls the window byte by byte till the next weak hit, the end of the buffer or the limit of literal data.
+    a = weak & 0xffff
+    b = weak >> 16
+    end = min(len(buffer) - block_size, literal + _max_literal_size)
+
+    while position < end:
+      out = buffer[position]
+      a = (a - out + buffer[position + block_size]) % _adler_modulus
+      b = (b - block_size * out + a - 1) % _adler_modulus
+      position += 1
+
+      if b << 16 | a in signatures:
+        break
+
+    weak = b << 16 | a
+
+    if position - literal >= _max_literal_size:
+      yield buffer[literal:position]
+      literal = position
+
+  if literal < len(buffer):
+    yield buffer[literal:]
@@ -0,0 +1,82 @@
+import io
+
+
+class PRawFile(io.RawIOBase):
+  '''Unbuffered binary file on a remote storage returned by PConnection.open. It adapts a file-like object of a backend to io.RawIOBase, so it can be wrapped by io.BufferedReader or io.BufferedWriter.'''
+
+  def __init__(self, stream, name: str, mode: str, on_close = None):
+    '''The constructor of PRawFile.
+
+    Args:
+      stream: Binary file-like object of a backend. It must have read or readinto, write, seek, tell and close methods. If it has seekable method, it is asked, whether seeking is possible.
+      name: Remote path of the file.
+      mode: One of 'rb', 'wb' or 'ab'.
+      on_close: Optional procedure without arguments called after the stream is closed.
+    '''
+    super().__init__()
+
+    self.__stream = stream
+    self.name = name
+    '''Remote path of the file.'''
+    self.mode = mode
+    '''The mode, in which the file was opened.'''
+
+    self.__on_close = on_close
+
+  def readable(self) -> bool:
+    return self.mode == 'rb'
+
+  def writable(self) -> bool:
+    return self.mode != 'rb'
+
+  def seekable(self) -> bool:
+    if hasattr(self.__stream, 'seekable'):
+      return self.__stream.seekable()
+
+    return True
+
+  def readinto(self, b) -> int:
+    self._checkClosed()
+    self._checkReadable()
+
+    if hasattr(self.__stream, 'readinto'):
+      return self.__stream.readinto(b)
+
+    data = self.__stream.read(len(b))
+    memoryview(b)[:len(data)] = data
+    return len(data)
+
+  def write(self, b) -> int:
+    self._checkClosed()
+    self._checkWritable()
+
+    written = self.__stream.write(bytes(b))
+
+    # Some streams (eg. paramiko SFTPFile) always write everything and return None.
+    if written is None:
+      return len(b)
+    return written
+
+  def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+    self._checkClosed()
+    self._checkSeekable()
+
+    self.__stream.seek(offset, whence)
+    return self.__stream.tell()
+
+  def tell(self) -> int:
+    self._checkClosed()
+    return self.__stream.tell()
+
+  def close(self):
+    if self.closed:
+      return
+
+    try:
+      self.__stream.close()
+
+    finally:
+      super().close()
+
+      if self.__on_close is not None:
+        self.__on_close()
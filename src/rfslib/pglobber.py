@@ -1,21 +1,68 @@
-# Original source file - https://github.com/python/cpython/blob/3.9/Lib/glob.py
-# THIS IS UTTERLY PIGGY SOLUTION OF THE PROBLEM! DEBUGGING IS WELCOME.
-# Don't use anything else then glob function - YOU HAVE BEEN WARNED.
-"""Filename globbing utility."""
+'''Resolution of remote wildcards. The rules are the same as the rules of the glob module of Python. Wildcards '*', '?' and '[...]' match inside of a single path segment,
+names starting with a dot are matched only by segments starting with a dot and '**' matches any files and zero or more folders.
 
-from os import path
+Every segment of a pattern is compiled to a regular expression once. The remote tree is walked like a nondeterministic automaton - every folder is visited together with the set of segments,
+which can follow its path, so only the folders, whose path can still match, are visited. Every visited folder is listed at most once (by one round trip) and types of its entries are taken from the listing.
+Symlinks to folders are matched by '**', but it doesn't descend into them, so cycles of symlinks can't make the walk infinite.
+
+Folders are visited level by level (a folder before its subfolders, folders of the same level in the order of their listings). With more jobs, listings of the folders,
+which are going to be visited next, are prefetched by a pool of cloned connections, so a deep walk waits for about one round trip per jobs folders.
+The folders are visited in the same order regardless of the number of jobs, so the result doesn't depend on it.'''
+
+from collections import deque
 import re
 import fnmatch
-import sys
 
 import logging
 
 _magic_check = re.compile('([*?[])')
-_magic_check_bytes = re.compile(b'([*?[])')
+
+
+def has_magic(s: str) -> bool:
+  '''Returns True, if the given path contains any wildcards.'''
+  return _magic_check.search(s) is not None
+
+
+def _join(dirname, name):
+  if dirname == '' or dirname.endswith('/'):
+    return dirname + name
+
+  return dirname + '/' + name
+
+
+class _segment():
+  '''A part of a pattern between two slashes.'''
+
+  def __init__(self, pattern, recursive):
+    self.pattern = pattern
+    self.recursive = recursive and pattern == '**'
+    self.magic = self.recursive or has_magic(pattern)
+
+    # Hidden names are matched only by a segment, which starts with a dot.
+    self.__hidden = pattern.startswith('.')
+    self.__match = re.compile(fnmatch.translate(pattern)).match if self.magic and not self.recursive else None
+
+  def matches(self, name):
+    if name.startswith('.') and not self.__hidden:
+      return False
+
+    return self.recursive or self.__match(name) is not None
+
 
 class PGlobber():
-  def __init__(self, connection):
+  '''Resolver of remote wildcards over a given connection.'''
+
+  def __init__(self, connection, jobs: int = 1, sort: bool = False):
+    '''The constructor of PGlobber.
+
+    Args:
+      connection: The PConnection used for listing of folders.
+      jobs: Number of folders listed at once. With more than one job, every job lists folders over its own clone of the connection.
+      sort: If True, entries of every folder are sorted by their names, so the order of the result doesn't depend on the order of listings.
+    '''
     self._connection = connection
+    self.__jobs = jobs
+    self.__sort = sort
 
   def glob(self, pathname, *, recursive=True):
     """Return a list of paths matching a pathname pattern.
@@ -25,155 +72,208 @@ class PGlobber():
     patterns.
     If recursive is true, the pattern '**' will match any files and
     zero or more directories and subdirectories.
+    If no path matches, a list with the pattern itself is returned.
     """
     logging.info("Resolving remote wildcard {}".format(pathname))
-    result = list(self._iglob(pathname, recursive=recursive))
+    result = list(self.iglob(pathname, recursive=recursive))
 
     if result == []:
       logging.warning("Wildcard {} failed resolution. Returning {}".format(pathname, pathname))
       return [pathname]
     else:
+      logging.info("Wildcard {} succeded resolution. Returning {}".format(pathname, "".join("\n" + r for r in result)))
+      return result
 
-      i_result = ""
-      for r in result:
-        i_result += "\n" + r
+  def iglob(self, pathname: str, *, recursive: bool = True):
+    '''Returns an iterator, which yields the remote paths matching a pathname pattern. Paths are yielded level by level in the order of listings (or sorted by names), so the order doesn't depend on the number of jobs.
 
-      logging.info("Wildcard {} succeded resolution. Returning {}".format(pathname, i_result))
-      return result
+    Args:
+      pathname: The pattern. Relative paths are yielded for a relative pattern, a relative pattern without any folder is resolved in the root folder. A pattern ending with a slash matches only folders and the yielded paths end with a slash.
+      recursive: If True, the pattern '**' matches any files and zero or more folders. Otherwise it is the same as '*'.
+    '''
+    if not has_magic(pathname):
+      dirname, basename = pathname.rsplit('/', 1) if '/' in pathname else ('', pathname)
 
-  def _iglob(self, pathname, *, recursive=False):
-    """Return an iterator which yields the paths matching a pathname pattern.
-    The pattern may contain simple shell-style wildcards a la
-    fnmatch. However, unlike fnmatch, filenames starting with a
-    dot are special cases that are not matched by '*' and '?'
-    patterns.
-    If recursive is true, the pattern '**' will match any files and
-    zero or more directories and subdirectories.
-    """
-    it = self.__iglob(pathname, recursive, False)
-    if recursive and self._isrecursive(pathname):
-      s = next(it)  # skip empty string
-      assert not s
-    return it
-
-  def __iglob(self, pathname, recursive, dironly):
-    dirname, basename = path.split(pathname)
-    if not self._has_magic(pathname):
-      assert not dironly
       if basename:
         if self._connection.lexists(pathname):
           yield pathname
-      else:
-        # Patterns ending with a slash should match only directories
-        if self._connection.isdir(dirname):
-          yield pathname
+
+      # Patterns ending with a slash should match only directories.
+      elif self._connection.isdir(dirname or '/'):
+        yield pathname
+
       return
-    if not dirname:
-      if recursive and self._isrecursive(basename):
-        yield from self._glob2(dirname, basename, dironly)
-      else:
-        yield from self.__glob1(dirname, basename, dironly)
+
+    dironly = pathname.endswith('/')
+
+    segments = []
+    for pattern in pathname.split('/'):
+      if pattern == '':
+        continue
+
+      segment = _segment(pattern, recursive)
+
+      # '**/**' matches the same paths as '**'.
+      if segment.recursive and segments and segments[-1].recursive:
+        continue
+
+      segments.append(segment)
+
+    # The literal beginning of the pattern is the first visited folder.
+    start = 0
+    while not segments[start].magic:
+      start += 1
+
+    top = '/' if pathname.startswith('/') else ''
+    for segment in segments[:start]:
+      top = _join(top, segment.pattern)
+
+    if self.__jobs <= 1:
+      yield from self.__walk(segments, dironly, top, start, None)
       return
-    # `os.path.split()` returns the argument itself as a dirname if it is a
-    # drive or UNC path.  Prevent an infinite recursion if a drive or UNC path
-    # contains magic characters (i.e. r'\\?\C:').
-    if dirname != pathname and self._has_magic(dirname):
-      dirs = __iglob(dirname, recursive, True)
-    else:
-      dirs = [dirname]
-    if self._has_magic(basename):
-      if recursive and self._isrecursive(basename):
-        self.glob_in_dir = self._glob2
+
+    from rfslib.pconnection_pool import PConnectionPool
+
+    with PConnectionPool(self._connection, self.__jobs) as pool:
+      yield from self.__walk(segments, dironly, top, start, pool)
+
+  # Adds the states, which follow from the given ones without consuming a path segment. ('**' can match zero folders.)
+  def __closure(self, segments, states):
+    ret = set(states)
+
+    for i in states:
+      if i < len(segments) and segments[i].recursive:
+        ret.add(i + 1)
+
+    return ret
+
+  # Lists a folder by the given connection and returns None, if it isn't a readable folder.
+  def __list(self, connection, path, is_dir):
+    try:
+      entries = list(connection.scandir(path or '/', is_dir=is_dir))
+
+    except OSError as e:
+      logging.debug(f"Remote folder {path} can't be listed while resolving a wildcard. ({e})")
+      return None
+
+    if self.__sort:
+      entries.sort(key=lambda entry: entry.name)
+
+    return entries
+
+  # Checks, whether a guessed path matches.
+  def __check(self, connection, path, dironly):
+    return connection.isdir(path) if dironly else connection.lexists(path)
+
+  # Submits listings of the folders and checks of the guessed paths in the beginning of the queue (the paths visited next) to the pool, till 2 * jobs of them are prefetched.
+  def __prefetch(self, segments, dironly, queue, pool):
+    n = len(segments)
+    prefetched = 0
+
+    for item in queue:
+      if prefetched == 2 * self.__jobs:
+        break
+
+      path, states, is_dir, future = item
+
+      if any(i < n and segments[i].magic for i in states):
+        if future is None:
+          item[3] = pool.submit(self.__list, path, is_dir is True)
+
+      elif is_dir is None and n in states:
+        if future is None:
+          item[3] = pool.submit(self.__check, path, dironly)
+
       else:
-        self.glob_in_dir = self.__glob1
-    else:
-      self.glob_in_dir = self.__glob0
-    for dirname in dirs:
-      for name in self.glob_in_dir(dirname, basename, dironly):
-        yield path.join(dirname, name)
-
-  # These 2 helper functions non-recursively glob inside a literal directory.
-  # They return a list of basenames.  __glob1 accepts a pattern while __glob0
-  # takes a literal basename (so it only has to check for its existence).
-
-  def __glob1(self, dirname, pattern, dironly):
-    names = list(self._iterdir(dirname, dironly))
-    if not self._ishidden(pattern):
-      names = (x for x in names if not self._ishidden(x))
-    return fnmatch.filter(names, pattern)
-
-  def __glob0(self, dirname, basename, dironly):
-    if not basename:
-      # `os.path.split()` returns an empty basename for paths ending with a
-      # directory separator.  'q*x/' should match only directories.
-      if self._connection.isdir(dirname):
-        return [basename]
-    else:
-      if self._connection.lexists(join(dirname, basename)):
-        return [basename]
-    return []
-
-
-  def _glob0(self, dirname, pattern):
-    return __glob0(dirname, pattern, False)
-
-  def _glob1(self, dirname, pattern):
-    return __glob1(dirname, pattern, False)
-
-  # This helper function recursively yields relative pathnames inside a literal
-  # directory.
-
-  def _glob2(self, dirname, pattern, dironly):
-    assert self._isrecursive(pattern)
-    yield pattern[:0]
-    yield from self._rlistdir(dirname, dironly)
-
-  # If dironly is false, yields all file names inside a directory.
-  # If dironly is true, yields only directory names.
-  def _iterdir(self, dirname, dironly):
-    if not dirname:
-      dirname = '/'
-    
-    for entry in self._connection.xls(dirname):
-      if not dironly or self._connection.isdir(entry):
-        yield path.basename(entry)
-    return
-
-  # Recursively yields relative pathnames inside a literal directory.
-  def _rlistdir(self, dirname, dironly):
-    names = list(self._iterdir(dirname, dironly))
-    for x in names:
-      if not self._ishidden(x):
-        yield x
-        lpath = path.join(dirname, x) if dirname else x
-        for y in self._rlistdir(lpath, dironly):
-          yield path.join(x, y)
-
-
-  def _has_magic(self, s):
-    if isinstance(s, bytes):
-      match = _magic_check_bytes.search(s)
-    else:
-      match = _magic_check.search(s)
-    return match is not None
+        continue
 
-  def _ishidden(self, path):
-    return path[0] in ('.', b'.'[0])
+      prefetched += 1
 
-  def _isrecursive(self, pattern):
-    if isinstance(pattern, bytes):
-      return pattern == b'**'
-    else:
-      return pattern == '**'
+  # Walks the tree by a queue of [path, states, is_dir, future]. States are indexes of segments, which can match the next part of path - path has already matched the segments before them.
+  # is_dir is True, if path is known to be a folder (eg. from the listing of its parent), and None, if path is a guess made by literal segments, which needn't exist.
+  # future is a future of the prefetched listing or check of path or None.
+  # Paths known from listings are yielded, when their parent is listed. Only the first folder and the guessed paths are checked, when they are taken from the queue.
+  def __walk(self, segments, dironly, top, start, pool):
+    n = len(segments)
+    queue = deque([[top, self.__closure(segments, {start}), True if top in ('', '/') else None, None]])
+    checked = False
 
-  def _escape(self, pathname):
-    """Escape all special characters.
-    """
-    # Escaping is done by wrapping any of "*?[" between square brackets.
-    # Metacharacters do not work in the drive part and shouldn't be _escaped.
-    drive, pathname = path.splitdrive(pathname)
-    if isinstance(pathname, bytes):
-      pathname = _magic_check_bytes.sub(br'[\1]', pathname)
-    else:
-      pathname = _magic_check.sub(r'[\1]', pathname)
-    return drive + pathname
+    while queue:
+      if pool is not None:
+        self.__prefetch(segments, dironly, queue, pool)
+
+      path, states, is_dir, future = queue.popleft()
+
+      guessed = is_dir is None
+      listed = any(i < n and segments[i].magic for i in states)
+      entries = None
+
+      if listed:
+        entries = future.result() if future is not None else self.__list(self._connection, path, is_dir is True)
+
+      if n in states and (guessed or not checked) and path != '':
+        if entries is not None:
+          matched = True
+        elif listed and not guessed:
+          matched = not dironly
+        elif listed:
+          # The listing of a guessed path failed, so it may be a file or nothing.
+          matched = not dironly and self._connection.lexists(path)
+        else:
+          matched = future.result() if future is not None else self.__check(self._connection, path, dironly)
+
+        if matched:
+          yield path + '/' if dironly else path
+
+      checked = True
+
+      if entries is None:
+        if not listed:
+          self.__guess(segments, path, states, queue)
+        continue
+
+      for entry in entries:
+        child_states = set()
+
+        for i in states:
+          # A segment followed by a slash matches only folders, even when the rest of the pattern is '**', which can match nothing.
+          if i == n or (i < n - 1 and not entry.is_dir()):
+            continue
+
+          segment = segments[i]
+
+          if segment.magic:
+            if not segment.matches(entry.name):
+              continue
+          elif entry.name != segment.pattern:
+            continue
+
+          child_states.add(i + 1)
+
+          # '**' goes on through the child folder, but not through a symlink.
+          if segment.recursive and entry.is_dir() and not entry.is_symlink():
+            child_states.add(i)
+
+        if not child_states:
+          continue
+
+        child_states = self.__closure(segments, child_states)
+        child = _join(path, entry.name)
+
+        if n in child_states and (entry.is_dir() or not dironly):
+          yield child + '/' if dironly else child
+
+        # A file can't be walked through.
+        if entry.is_dir() and any(i < n for i in child_states):
+          queue.append([child, child_states, True, None])
+
+  # Queues the paths made by literal segments from a folder, which isn't listed.
+  def __guess(self, segments, path, states, queue):
+    children = {}
+
+    for i in states:
+      if i < len(segments):
+        name = segments[i].pattern
+        children.setdefault(name, set()).add(i + 1)
+
+    queue.extend([_join(path, name), self.__closure(segments, child_states), None, None] for name, child_states in children.items())
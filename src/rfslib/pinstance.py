@@ -1,12 +1,44 @@
+import logging
+import sys
 
 class PInstance():
   def __init__(self):
     self.connection = None
+    self.stats = None
+    self.trace = None
+    self.trace_span = None
+    self.profiler = None
 
   def close(self):
     if self.connection != None:
+      if self.connection.get_settings().metadata_cache:
+        logging.info(f"Metadata cache hits: {self.connection.get_metadata_cache_hits()}, misses: {self.connection.get_metadata_cache_misses()}.")
+
+      settings = self.connection.get_settings()
       self.connection.close()
 
+      if settings.stats is not None:
+        print(settings.stats.report(self.stats), file=sys.stderr)
+
+      if self.trace_span is not None:
+        settings.tracer.end_span(self.trace_span)
+        settings.tracer.write(self.trace)
+
+    if self.profiler is not None:
+      self.profiler.stop()
+
+  # Returns a new connection of local paths with the settings of the connection. The listing cache, the stats and the tracer belong to the remote storage, so the local connection doesn't use them.
+  def local_connection(self):
+    from rfslib.fs_pconnection import FsPConnection
+
+    settings = self.connection.get_settings()
+    settings.listing_cache_file = None
+    settings.listing_cache_identity = ''
+    settings.stats = None
+    settings.tracer = None
+
+    return FsPConnection(settings)
+
   def __enter__(self):
     return self
 
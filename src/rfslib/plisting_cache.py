@@ -0,0 +1,134 @@
+'''Persistent cache of listings of remote folders, which is shared by all commands (and processes) using the same database file.
+Listings are stored in SQLite together with the modification time and size of the listed folder. A cached listing is reused, if a stat of the folder returns the same values,
+so an unchanged folder costs one stat instead of a whole listing. Within ttl seconds after it was stored or validated, a listing is trusted even without the stat.'''
+
+import json
+import os, os.path
+import time
+
+import logging
+
+from rfslib.path_utils import path_normalize
+from rfslib.default_paths import default_cache_path
+
+
+class PListingCache():
+  '''Persistent cache of listings of remote folders of one remote storage. Entries are stored as tuples (name, is_dir, is_symlink, attributes), where attributes is a dictionary of stat fields or None.
+  The database is opened lazily by the thread, which uses the cache first. Every thread (eg. every clone of a connection) should use its own instance.'''
+
+  def __init__(self, file: str, identity: str, ttl: float):
+    '''The constructor of PListingCache.
+
+    Args:
+      file: Path of the SQLite database. Missing folders are created.
+      identity: Identity of the remote storage (eg. connection type, user, host and port). Listings of different storages in one database don't mix.
+      ttl: Time in seconds, for which a stored or validated listing is trusted without a stat of the folder. 0 means, that every reuse is validated.
+    '''
+    self.__file = file
+    self.__identity = identity
+    self.__ttl = ttl
+
+    self.__db = None
+
+    self.hits = 0
+    '''Number of listings answered from the cache.'''
+    self.misses = 0
+    '''Number of listings, which had to be passed to the connection.'''
+
+  # Opens the database and creates the table, if it doesn't exist.
+  def __open(self):
+    if self.__db is not None:
+      return self.__db
+
+    import sqlite3
+
+    os.makedirs(os.path.dirname(os.path.abspath(self.__file)), exist_ok=True)
+
+    db = sqlite3.connect(self.__file, timeout=30, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('CREATE TABLE IF NOT EXISTS listings (identity TEXT NOT NULL, path TEXT NOT NULL, mtime REAL, size INTEGER, validated REAL NOT NULL, entries TEXT NOT NULL, ' +
+      'PRIMARY KEY (identity, path))')
+
+    self.__db = db
+    return db
+
+  def lookup(self, remote_path: str, folder_stat):
+    '''Returns the cached entries of a folder, or None, if there is no valid cached listing.
+
+    Args:
+      remote_path: Path of a remote folder.
+      folder_stat: Function, which returns the p_stat_result of the folder. It is called only, if the cached listing has to be validated.
+    '''
+    key = path_normalize(remote_path)
+    row = self.__open().execute('SELECT mtime, size, validated, entries FROM listings WHERE identity = ? AND path = ?', (self.__identity, key)).fetchone()
+
+    if row is None:
+      self.misses += 1
+      return None
+
+    mtime, size, validated, entries = row
+
+    if time.time() - validated >= self.__ttl:
+      st = folder_stat()
+
+      if mtime is None or (st.st_mtime, st.st_size) != (mtime, size):
+        logging.debug(f"Cached listing of remote folder {remote_path} is outdated.")
+        self.misses += 1
+        return None
+
+      self.__db.execute('UPDATE listings SET validated = ? WHERE identity = ? AND path = ?', (time.time(), self.__identity, key))
+
+    self.hits += 1
+    return [tuple(entry) for entry in json.loads(entries)]
+
+  def put(self, remote_path: str, st, entries: list):
+    '''Stores a listing of a folder.
+
+    Args:
+      remote_path: Path of a remote folder.
+      st: The p_stat_result of the folder taken before it was listed, so a change made during the listing makes the stored listing outdated.
+      entries: List of tuples (name, is_dir, is_symlink, attributes).
+    '''
+    key = path_normalize(remote_path)
+    mtime = st.st_mtime
+
+    # A coarse modification time (eg. minutes over FTP, or whole seconds over SFTP) doesn't change by changes made in the same period. Such a folder isn't validated by the stat
+    # (it is trusted only for ttl), till its last change is at least a day older than the local time, which covers any time zone shift or clock skew of the server.
+    precision = getattr(st, '_st_mtime_precision', 0) or 0
+    if mtime is not None and float(mtime).is_integer():
+      precision = max(precision, 1)
+
+    if mtime is not None and precision >= 1 and time.time() - mtime < precision + 86400:
+      mtime = None
+
+    self.__open().execute('INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?)',
+      (self.__identity, key, mtime, st.st_size, time.time(), json.dumps(entries, default=str)))
+
+  def invalidate(self, remote_path: str, recursive: bool = False):
+    '''Drops the cached listings of remote_path and its parent directory.
+
+    Args:
+      remote_path: A modified remote path.
+      recursive: If True, listings of all folders inside remote_path are dropped too. (eg. after rename of a directory)
+    '''
+    if self.__db is None and not os.path.exists(self.__file):
+      return
+
+    key = path_normalize(remote_path)
+    db = self.__open()
+
+    db.execute('DELETE FROM listings WHERE identity = ? AND path IN (?, ?)', (self.__identity, key, os.path.dirname(key)))
+
+    if recursive:
+      prefix = key.rstrip('/') + '/'
+      db.execute("DELETE FROM listings WHERE identity = ? AND substr(path, 1, ?) = ?", (self.__identity, len(prefix), prefix))
+
+  def clear(self):
+    '''Drops all cached listings of the remote storage.'''
+    self.__open().execute('DELETE FROM listings WHERE identity = ?', (self.__identity,))
+
+  def close(self):
+    '''Closes the database.'''
+    if self.__db is not None:
+      self.__db.close()
+      self.__db = None
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import os.path
+import time
+
+from rfslib.path_utils import path_normalize
+
+
+class PMetadataCache():
+  '''Cache of metadata lookups (eg. exists, isdir, lstat) of one PConnection. Negative lookups are cached too.
+  Entries expire after ttl seconds and when more than size paths are cached, the least recently used ones are evicted.'''
+
+  def __init__(self, ttl: float, size: int):
+    '''The constructor of PMetadataCache.
+
+    Args:
+      ttl: Time in seconds, after which a cached entry expires.
+      size: Maximal number of cached paths.
+    '''
+    self.__ttl = ttl
+    self.__size = size
+
+    # path -> {kind: (expiry, value)}
+    self.__entries = OrderedDict()
+
+    self.hits = 0
+    '''Number of lookups answered from the cache.'''
+    self.misses = 0
+    '''Number of lookups, which had to be passed to the connection.'''
+
+  def lookup(self, kind: str, remote_path: str, fetch):
+    '''Returns a cached value of the lookup kind for remote_path. If there is no valid cached value, fetch(remote_path) is called and its result is cached.
+    Exceptions raised by fetch are not cached.
+
+    Args:
+      kind: Name of the lookup (eg. '_isdir').
+      remote_path: Path of a remote file.
+      fetch: Function, which does the lookup on the remote storage.
+    '''
+    key = path_normalize(remote_path)
+    entry = self.__entries.get(key)
+
+    if entry is not None and kind in entry:
+      expiry, value = entry[kind]
+
+      if expiry > time.monotonic():
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return value
+
+    self.misses += 1
+    value = fetch(remote_path)
+    self.put(kind, remote_path, value)
+
+    return value
+
+  def put(self, kind: str, remote_path: str, value):
+    '''Stores a value of the lookup kind for remote_path.'''
+    key = path_normalize(remote_path)
+
+    entry = self.__entries.get(key)
+    if entry is None:
+      entry = {}
+      self.__entries[key] = entry
+
+      if len(self.__entries) > self.__size:
+        self.__entries.popitem(last=False)
+
+    else:
+      self.__entries.move_to_end(key)
+
+    entry[kind] = (time.monotonic() + self.__ttl, value)
+
+  def invalidate(self, remote_path: str, recursive: bool = False):
+    '''Drops all cached entries of remote_path and its parent directory.
+
+    Args:
+      remote_path: A modified remote path.
+      recursive: If True, entries of all files inside remote_path are dropped too. (eg. after rename of a directory)
+    '''
+    key = path_normalize(remote_path)
+
+    self.__entries.pop(key, None)
+    self.__entries.pop(os.path.dirname(key), None)
+
+    if recursive:
+      prefix = key.rstrip('/') + '/'
+      for cached in [k for k in self.__entries if k.startswith(prefix)]:
+        del self.__entries[cached]
+
+  def clear(self):
+    '''Drops all cached entries.'''
+    self.__entries.clear()
+
+  def __len__(self):
+    return len(self.__entries)
@@ -0,0 +1,34 @@
+'''Adapter, which passes spans of rfslib tracing to OpenTelemetry. It needs the package opentelemetry-api (pip install rfstools[opentelemetry]) and an SDK configured by the application.'''
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from rfslib.ptracing import PTracer, PSpan
+
+
+class POpenTelemetryTracer(PTracer):
+  '''A tracer, which starts an OpenTelemetry span for every traced call. Spans of calls, which aren't made inside another traced call, are children of the current OpenTelemetry span of the application.'''
+
+  def __init__(self, tracer: trace.Tracer = None):
+    '''The constructor of POpenTelemetryTracer.
+
+    Args:
+      tracer: The OpenTelemetry tracer. Defaults to the tracer 'rfslib' of the global tracer provider.
+    '''
+    self.__tracer = tracer if tracer is not None else trace.get_tracer('rfslib')
+
+  def on_start(self, span: PSpan):
+    context = trace.set_span_in_context(span.parent.data) if span.parent is not None else None
+    span.data = self.__tracer.start_span(span.name, context=context, attributes=span.attributes)
+
+  def on_end(self, span: PSpan):
+    otel_span = span.data
+
+    if 'bytes' in span.attributes:
+      otel_span.set_attribute('bytes', span.attributes['bytes'])
+
+    if span.error is not None:
+      otel_span.record_exception(span.error)
+      otel_span.set_status(Status(StatusCode.ERROR, f"{type(span.error).__name__}: {span.error}"))
+
+    otel_span.end()
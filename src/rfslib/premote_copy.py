@@ -0,0 +1,122 @@
+'''Copies made by the remote storage itself, used by PConnection.fcp and push with delta. A server side copy moves no data through the local host,
+a delta push copies the old version of a file on the server and patches the copy by the blocks, which changed. The module is imported only by commands, which copy remote files.'''
+
+import os.path
+
+import logging
+
+from rfslib import pdelta
+from rfslib.abstract_pconnection import _write_all
+
+
+# Searching of unchanged blocks in changed data is slow, so the delta transfer is given up early, if most of the first bytes are changed.
+_delta_probe_size = 64 * 1024 * 1024
+
+
+def server_copy(connection, old_name: str, new_name: str, tmp_file: str):
+  '''Copies a remote file on the server into a temporary file, which is then moved over new_name.
+
+  Args:
+    connection: The PConnection to the remote storage.
+    old_name: The copied remote file.
+    new_name: The remote destination.
+    tmp_file: A free remote path next to new_name.
+
+  Raises:
+    NotImplementedError: The remote storage can't copy files itself. Nothing is changed then.
+  '''
+  try:
+    connection._server_copy(old_name, tmp_file)
+
+  except BaseException:
+    if connection._lexists(tmp_file):
+      connection._unlink(tmp_file)
+    raise
+
+  connection.fmv(tmp_file, new_name)
+
+
+def delta_push(connection, local_path: str, remote_path: str, tmp_file: str, block_size: int) -> bool:
+  '''Pushes a local file over its existing remote version by the rsync algorithm. The remote version is copied on the server to a temporary file, which is patched and moved over it.
+
+  Args:
+    connection: The PConnection to the remote storage.
+    local_path: Path of a local file to upload.
+    remote_path: The existing remote version of the file.
+    tmp_file: A free remote path next to remote_path.
+    block_size: Size of the compared blocks. 0 means, that it is chosen by the size of the remote version.
+
+  Returns:
+    False, if the delta transfer isn't worthwhile. The remote file is unchanged then.
+
+  Raises:
+    NotImplementedError: The remote storage can't copy files itself or write to random positions of a file. The remote file is unchanged then.
+  '''
+  size = os.path.getsize(local_path)
+  basis_size = connection.stat(remote_path).st_size
+  block_size = block_size or pdelta.block_size(basis_size)
+
+  if size < block_size or basis_size < block_size:
+    return False
+
+  try:
+    connection._server_copy(remote_path, tmp_file)
+    literal_size = _patch(connection, local_path, remote_path, tmp_file, size, block_size)
+
+  except BaseException:
+    if connection._lexists(tmp_file):
+      connection._unlink(tmp_file)
+    raise
+
+  if literal_size is None:
+    if connection._lexists(tmp_file):
+      connection._unlink(tmp_file)
+    return False
+
+  connection.fmv(tmp_file, remote_path)
+
+  logging.info(f"Delta transfer of local file {local_path} to the remote file {remote_path}: sent {literal_size} of {size} bytes, compression ratio {size / max(literal_size, 1):.1f}.")
+  return True
+
+
+# Rewrites tmp_file, a copy of remote_path, to the content of local_path. Only blocks, which aren't in the same place of remote_path, are written.
+# Returns number of sent bytes or None, if the local file differs so much, that the whole file is cheaper to push.
+def _patch(connection, local_path, remote_path, tmp_file, size, block_size):
+  literal_size = 0
+  position = 0
+
+  # A run of consecutive blocks copied from the basis - basis offset, target offset and length.
+  run = None
+
+  with connection._open(tmp_file, 'r+b') as target:
+    with connection.open(remote_path, 'rb') as basis:
+      signatures = pdelta.signatures(basis, block_size)
+
+    with connection._open(remote_path, 'rb') as basis, open(local_path, 'rb') as source:
+      for instruction in pdelta.delta(source, signatures, block_size):
+        if isinstance(instruction, int):
+          if run is not None and run[0] + run[2] == instruction and run[1] + run[2] == position:
+            run[2] += block_size
+          else:
+            if run is not None and run[0] != run[1]:
+              connection._copy_range(basis, run[0], run[2], target, run[1])
+            run = [instruction, position, block_size]
+
+          position += block_size
+          continue
+
+        literal_size += len(instruction)
+        if literal_size > size // 2 or (literal_size > _delta_probe_size and literal_size > position // 2):
+          logging.info(f"Local file {local_path} differs too much from the remote file {remote_path}. The whole file will be pushed.")
+          return None
+
+        target.seek(position)
+        _write_all(target, instruction)
+        position += len(instruction)
+
+      if run is not None and run[0] != run[1]:
+        connection._copy_range(basis, run[0], run[2], target, run[1])
+
+    target.truncate(size)
+
+  return literal_size
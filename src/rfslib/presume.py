@@ -0,0 +1,92 @@
+'''Resumable transfers used by PConnection.push and pull with resume. A file is transferred into a partial file .NAME.part next to its destination,
+which is left there, if the transfer fails, and continued by the next transfer of the same file. The module is imported only by commands, which resume transfers.'''
+
+import os, os.path
+import shutil
+
+import logging
+
+
+def partial_file(path: str) -> str:
+  '''Returns the path of the partial file of a destination path.'''
+  dirname, basename = os.path.split(path)
+  return os.path.join(dirname, '.' + basename + '.part')
+
+
+# Decides, whether a partial file left by an interrupted transfer can be continued.
+# If verify_size is set, the last block of the partial file must be the same as in the source.
+def _resumable(partial_size, source_size, open_source, open_partial, verify_size) -> bool:
+  if partial_size == 0 or partial_size > source_size:
+    return False
+
+  size = min(verify_size, partial_size)
+  if size == 0:
+    return True
+
+  with open_source() as source, open_partial() as partial:
+    source.seek(partial_size - size)
+    partial.seek(partial_size - size)
+
+    return source.read(size) == partial.read(size)
+
+
+def push(connection, local_path: str, partial_file: str, verify_size: int, buffer_size: int):
+  '''Uploads a local file into a remote partial file. The partial file is continued, if it is a beginning of the local file, otherwise it is replaced.
+
+  Args:
+    connection: The PConnection to the remote storage.
+    local_path: Path of a local file to upload.
+    partial_file: The remote partial file.
+    verify_size: Number of the last bytes of the partial file compared with the local file, before it is continued. 0 means, that only sizes are compared.
+    buffer_size: Size of blocks, in which a continued file is uploaded.
+  '''
+  offset = 0
+
+  if connection._lexists(partial_file):
+    offset = connection.stat(partial_file).st_size
+
+    if not _resumable(offset, os.path.getsize(local_path), lambda: open(local_path, 'rb'), lambda: connection.open(partial_file, 'rb'), verify_size):
+      logging.info(f"Remote partial file {partial_file} can't be resumed. Pushing {local_path} from the beginning.")
+      connection._unlink(partial_file)
+      offset = 0
+
+  if offset == 0:
+    connection._push(local_path, partial_file)
+    return
+
+  logging.info(f"Resuming push of local file {local_path} to the remote partial file {partial_file} from byte {offset}.")
+
+  with open(local_path, 'rb') as source, connection.open(partial_file, 'ab') as partial:
+    source.seek(offset)
+    shutil.copyfileobj(source, partial, buffer_size)
+
+
+def pull(connection, remote_path: str, partial_file: str, verify_size: int, buffer_size: int):
+  '''Downloads a remote file into a local partial file. The partial file is continued, if it is a beginning of the remote file, otherwise it is replaced.
+
+  Args:
+    connection: The PConnection to the remote storage.
+    remote_path: Path of a remote file to download.
+    partial_file: The local partial file.
+    verify_size: Number of the last bytes of the partial file compared with the remote file, before it is continued. 0 means, that only sizes are compared.
+    buffer_size: Size of blocks, in which a continued file is downloaded.
+  '''
+  offset = 0
+
+  if os.path.lexists(partial_file):
+    offset = os.path.getsize(partial_file)
+
+    if not _resumable(offset, connection.stat(remote_path).st_size, lambda: connection.open(remote_path, 'rb'), lambda: open(partial_file, 'rb'), verify_size):
+      logging.info(f"Local partial file {partial_file} can't be resumed. Pulling {remote_path} from the beginning.")
+      os.unlink(partial_file)
+      offset = 0
+
+  if offset == 0:
+    connection._pull(remote_path, partial_file)
+    return
+
+  logging.info(f"Resuming pull of remote file {remote_path} to the local partial file {partial_file} from byte {offset}.")
+
+  with connection.open(remote_path, 'rb') as source, open(partial_file, 'ab') as partial:
+    source.seek(offset)
+    shutil.copyfileobj(source, partial, buffer_size)
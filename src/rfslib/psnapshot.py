@@ -0,0 +1,277 @@
+'''Snapshots of remote or local trees, which can be compared with each other without listing the trees again.
+
+A snapshot is a single binary file, which is read through mmap, so opening even a snapshot of millions of files costs nothing and only the compared parts are paged in.
+It consists of a header, fixed-size records of folders, fixed-size records of entries (files, folders and symlinks) and a blob of names. Entries of every folder are stored
+one after another sorted by name. Every folder record carries a rollup hash of the names, types and attributes of its entries, where a subfolder is represented by its own rollup,
+so two folders with the same rollup contain the same trees and a comparison skips them without reading their entries.
+
+A snapshot is written by a bottom-up walk (one listing per folder), so only the listings of the folders on the current path are held in memory.'''
+
+import hashlib
+import mmap
+import os
+import shutil
+import stat
+import struct
+import tempfile
+
+import logging
+
+from rfslib.path_utils import path_normalize
+
+
+FILE = 0
+'''Type of an entry, which is a regular file (or any other file, which isn't a folder or a symlink).'''
+DIRECTORY = 1
+'''Type of an entry, which is a folder.'''
+SYMLINK = 2
+'''Type of an entry, which is a symlink.'''
+
+_magic = b'RFSSNAP1'
+
+# magic, number of folders, number of entries, offset of folders, offset of entries, offset of names, offset and length of the root path in names
+_header = struct.Struct('<8sQQQQQQI')
+# offset and length of the relative path in names, index of the first entry, number of entries, rollup
+_folder = struct.Struct('<QIQI16s')
+# offset and length of the name in names, type, mode, size, mtime, index of the folder of a subfolder (otherwise -1)
+_entry = struct.Struct('<QIBIQdq')
+
+_rollup_attrs = struct.Struct('<BIQd')
+
+
+def _encode(name):
+  return name.encode('utf-8', 'surrogateescape')
+
+
+def _decode(name):
+  return name.decode('utf-8', 'surrogateescape')
+
+
+def _entry_type(entry, mode):
+  if entry.is_symlink() or (mode is not None and stat.S_ISLNK(mode)):
+    return SYMLINK
+  elif entry.is_dir():
+    return DIRECTORY
+  else:
+    return FILE
+
+
+def write_snapshot(connection, remote_path: str, snapshot_path: str):
+  '''Walks the tree of a folder and writes its snapshot.
+
+  Args:
+    connection: The PConnection, whose folder is snapshotted. (eg. FsPConnection for a local tree)
+    remote_path: The path of the folder.
+    snapshot_path: The local path of the written snapshot file. It is replaced only after the whole snapshot is written.
+
+  Returns:
+    A pair (number of folders, number of entries) of the snapshot.
+  '''
+  logging.info(f"Writing snapshot of folder {remote_path} into {snapshot_path}.")
+
+  root = path_normalize(remote_path)
+  folders = 0
+  entries = 0
+
+  # Indexes of the walked folders, which weren't consumed by their parents yet, and their rollups.
+  walked = {}
+
+  def onerror(e):
+    logging.error(f"A folder can't be listed and it is snapshotted as empty. ({e})")
+
+  with tempfile.TemporaryFile() as folder_f, tempfile.TemporaryFile() as entry_f, tempfile.TemporaryFile() as name_f:
+    names_size = 0
+
+    def add_name(name):
+      nonlocal names_size
+      data = _encode(name)
+      name_f.write(data)
+      names_size += len(data)
+      return names_size - len(data), len(data)
+
+    for dirpath, dirs, nondirs in connection.walk(root, top_down=False, onerror=onerror):
+      rollup = hashlib.blake2b(digest_size=16)
+      first = entries
+
+      for entry in sorted(dirs + nondirs, key=lambda entry: entry.name):
+        st = entry.lstat()
+        if st is None:
+          st = connection.lstat(entry.path)
+
+        mode = st.st_mode or 0
+        e_type = _entry_type(entry, st.st_mode)
+        child = -1
+
+        rollup.update(_encode(entry.name) + b'\0')
+
+        if e_type == DIRECTORY:
+          child, child_rollup = walked.pop(entry.path, (-1, b'\0' * 16))
+          size, mtime = 0, 0.0
+          rollup.update(_rollup_attrs.pack(e_type, mode, 0, 0.0) + child_rollup)
+        else:
+          size, mtime = st.st_size or 0, float(st.st_mtime or 0)
+          rollup.update(_rollup_attrs.pack(e_type, mode, size, mtime))
+
+        name_off, name_len = add_name(entry.name)
+        entry_f.write(_entry.pack(name_off, name_len, e_type, mode, size, mtime, child))
+        entries += 1
+
+      digest = rollup.digest()
+      path_off, path_len = add_name(dirpath[len(root):].lstrip('/'))
+      folder_f.write(_folder.pack(path_off, path_len, first, entries - first, digest))
+
+      walked[dirpath] = (folders, digest)
+      folders += 1
+
+    if root not in walked:
+      raise OSError(f"Folder {remote_path} can't be listed.")
+
+    root_off, root_len = add_name(root)
+
+    tmp_path = snapshot_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      folders_off = _header.size
+      entries_off = folders_off + folders * _folder.size
+      names_off = entries_off + entries * _entry.size
+
+      f.write(_header.pack(_magic, folders, entries, folders_off, entries_off, names_off, root_off, root_len))
+
+      for section in (folder_f, entry_f, name_f):
+        section.seek(0)
+        shutil.copyfileobj(section, f)
+
+    os.replace(tmp_path, snapshot_path)
+
+  logging.info(f"Snapshot of {folders} folders and {entries} entries written into {snapshot_path}.")
+  return folders, entries
+
+
+def is_snapshot(path: str) -> bool:
+  '''Returns True, if the given local path is a snapshot file.'''
+  if not os.path.isfile(path):
+    return False
+
+  with open(path, 'rb') as f:
+    return f.read(len(_magic)) == _magic
+
+
+class PSnapshot():
+  '''A snapshot file opened for reading. Folders are addressed by their indexes, the root folder is the last one.'''
+
+  def __init__(self, snapshot_path: str):
+    '''The constructor of PSnapshot.
+
+    Args:
+      snapshot_path: The local path of a snapshot file written by write_snapshot.
+    '''
+    self.__file = open(snapshot_path, 'rb')
+
+    try:
+      self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      self.__file.close()
+      raise ValueError(f"File {snapshot_path} isn't a snapshot.")
+
+    if self.__map.size() < _header.size or self.__map[:len(_magic)] != _magic:
+      self.close()
+      raise ValueError(f"File {snapshot_path} isn't a snapshot.")
+
+    magic, self.folders, self.entries, self.__folders_off, self.__entries_off, self.__names_off, root_off, root_len = _header.unpack_from(self.__map, 0)
+
+    self.root_path = self.__name(root_off, root_len)
+    '''The path of the snapshotted folder.'''
+
+  # Decodes a name (or a path) stored in the blob of names.
+  def __name(self, offset, length):
+    start = self.__names_off + offset
+    return _decode(self.__map[start:start + length])
+
+  @property
+  def root(self) -> int:
+    '''The index of the root folder.'''
+    return self.folders - 1
+
+  def folder(self, index: int):
+    '''Returns a tuple (path, rollup) of a folder, where path is relative to the root folder.'''
+    path_off, path_len, first, count, rollup = _folder.unpack_from(self.__map, self.__folders_off + index * _folder.size)
+    return self.__name(path_off, path_len), rollup
+
+  def listing(self, index: int):
+    '''Returns a list of entries of a folder sorted by name. Every entry is a tuple (name, type, mode, size, mtime, folder), where folder is the index of a subfolder or -1.'''
+    path_off, path_len, first, count, rollup = _folder.unpack_from(self.__map, self.__folders_off + index * _folder.size)
+
+    ret = []
+    for i in range(first, first + count):
+      name_off, name_len, e_type, mode, size, mtime, child = _entry.unpack_from(self.__map, self.__entries_off + i * _entry.size)
+      ret.append((self.__name(name_off, name_len), e_type, mode, size, mtime, child))
+
+    return ret
+
+  def close(self):
+    '''Closes the snapshot file.'''
+    self.__map.close()
+    self.__file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, x, y, z):
+    self.close()
+
+
+def _join(dirname, name):
+  return dirname + '/' + name if dirname else name
+
+
+def diff(old: PSnapshot, new: PSnapshot):
+  '''Compares two snapshots. Only the folders, whose rollups differ, are read, so identical subtrees are skipped.
+
+  Args:
+    old: The old snapshot.
+    new: The new snapshot.
+
+  Yields:
+    Pairs (change, path) in the order of a top-down walk, where path is relative to the root folders (the root folder itself is './') and ends with a slash for folders. change is 'D' for a folder, whose tree changed
+    (yielded before its changes), '+' for an added entry, '-' for a removed entry and 'M' for an entry with changed type or attributes. Contents of added and removed folders aren't listed.
+  '''
+  stack = [(old.root, new.root)]
+
+  while stack:
+    i, j = stack.pop()
+    path, old_rollup = old.folder(i)
+    _, new_rollup = new.folder(j)
+
+    if old_rollup == new_rollup:
+      continue
+
+    yield 'D', _join(path, '') or './'
+
+    old_entries = old.listing(i)
+    new_entries = new.listing(j)
+    subfolders = []
+
+    a = b = 0
+    while a < len(old_entries) or b < len(new_entries):
+      if b == len(new_entries) or (a < len(old_entries) and old_entries[a][0] < new_entries[b][0]):
+        entry = old_entries[a]
+        yield '-', _join(path, entry[0] + ('/' if entry[1] == DIRECTORY else ''))
+        a += 1
+        continue
+
+      if a == len(old_entries) or new_entries[b][0] < old_entries[a][0]:
+        entry = new_entries[b]
+        yield '+', _join(path, entry[0] + ('/' if entry[1] == DIRECTORY else ''))
+        b += 1
+        continue
+
+      old_entry, new_entry = old_entries[a], new_entries[b]
+      a += 1
+      b += 1
+
+      if old_entry[1:5] != new_entry[1:5]:
+        yield 'M', _join(path, new_entry[0] + ('/' if new_entry[1] == DIRECTORY else ''))
+
+      if old_entry[1] == DIRECTORY and new_entry[1] == DIRECTORY and old_entry[5] >= 0 and new_entry[5] >= 0:
+        subfolders.append((old_entry[5], new_entry[5]))
+
+    stack.extend(reversed(subfolders))
@@ -0,0 +1,339 @@
+from rfslib.path_utils import GenericPath, path_normalize
+
+import os, os.path
+import shutil
+import stat
+import threading
+
+import logging
+
+
+class _sync_entry():
+  '''Type, size and modification time of a file taking part in a synchronization. The real modification time may be up to mtime_precision seconds later than mtime.'''
+
+  def __init__(self, path: str, is_dir: bool, size: int, mtime: float, mtime_precision: float = 0):
+    self.path = path
+    self.is_dir = is_dir
+    self.size = size
+    self.mtime = mtime
+    self.mtime_precision = mtime_precision
+
+
+def _mtime_precision(st, raw_st) -> float:
+  # ftputil knows, that times in FTP listings are truncated to minutes (or days for old files).
+  precision = getattr(raw_st, '_st_mtime_precision', 0) or 0
+
+  # SFTP version 3 transfers times in whole seconds.
+  if float(st.st_mtime).is_integer():
+    precision = max(precision, 1)
+
+  return precision
+
+
+class _local_tree():
+  '''Access to the local side of a synchronization.'''
+
+  def lookup(self, path):
+    if not os.path.exists(path):
+      return None
+
+    st = os.stat(path)
+    return _sync_entry(path, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime)
+
+  def entries(self, path) -> dict:
+    ret = {}
+
+    with os.scandir(path) as it:
+      for entry in it:
+        try:
+          st = entry.stat()
+        except FileNotFoundError:
+          logging.warning(f"Skipping broken symlink {entry.path}.")
+          continue
+
+        ret[entry.name] = _sync_entry(entry.path, entry.is_dir(), st.st_size, st.st_mtime)
+
+    return ret
+
+  def join(self, path, name):
+    return os.path.join(path, name)
+
+  def mkdir(self, path):
+    os.mkdir(path)
+
+  def remove(self, path):
+    if os.path.isdir(path) and not os.path.islink(path):
+      shutil.rmtree(path)
+    else:
+      os.unlink(path)
+
+  def open(self, path):
+    return open(path, 'rb')
+
+
+class _remote_tree():
+  '''Access to the remote side of a synchronization.'''
+
+  def __init__(self, connection):
+    self.__connection = connection
+
+  def lookup(self, path):
+    if not self.__connection.exists(path):
+      return None
+
+    st = self.__connection.stat(path)
+    return _sync_entry(path, self.__connection.isdir(path), st.st_size, st.st_mtime, _mtime_precision(st, None))
+
+  def entries(self, path) -> dict:
+    ret = {}
+
+    for entry in self.__connection.scandir(path):
+      st = entry.lstat()
+
+      # Attributes of the listing describe the symlink itself, not its target.
+      if st is None or entry.is_symlink():
+        if not self.__connection.exists(entry.path):
+          logging.warning(f"Skipping broken symlink {entry.path}.")
+          continue
+
+        st = self.__connection.stat(entry.path)
+        precision = _mtime_precision(st, None)
+
+      else:
+        precision = _mtime_precision(st, entry._raw_lstat())
+
+      ret[entry.name] = _sync_entry(entry.path, entry.is_dir(), st.st_size, st.st_mtime, precision)
+
+    return ret
+
+  def join(self, path, name):
+    return os.path.join(path, name)
+
+  def mkdir(self, path):
+    self.__connection.mkdir(path)
+
+  def remove(self, path):
+    self.__connection.rm(path, recursive=True)
+
+  def open(self, path):
+    return self.__connection.open(path, 'rb')
+
+
+class PSynchronizer():
+  '''One-way synchronization of trees between the local and the remote storage. Only new and changed files are transferred.
+  By default, a file is changed, if its size differs, or if the source is newer than the destination. (the destination gets the time of the transfer)'''
+
+  # Size of blocks read, when files are compared by checksums.
+  __checksum_block_size = 1024 * 1024
+
+  def __init__(self, connection, checksum: bool = False, delete: bool = False, modify_window: float = 0, jobs: int = 1):
+    '''The constructor of PSynchronizer.
+
+    Args:
+      connection: The PConnection to the remote storage.
+      checksum: Compares files with the same size by SHA-256 checksums of their content instead of their modification times.
+      delete: Deletes files in destination folders, which don't exist in the source folders.
+      modify_window: Modification times differing less than given number of seconds are considered equal.
+      jobs: Number of files transferred at once between the local and the remote storage.
+    '''
+    self.__connection = connection
+    self.__checksum = checksum
+    self.__delete = delete
+    self.__modify_window = modify_window
+
+    # Recoded files have different sizes and contents on each side.
+    self.__text_transmission = connection.get_settings().text_transmission
+    if checksum and self.__text_transmission:
+      raise ValueError("Checksum comparison can't be used together with text transmission.")
+
+    self.__engine = None
+    if jobs > 1:
+      from rfslib.ptransfer import PTransferEngine
+      self.__engine = PTransferEngine(connection, jobs)
+    self.__failures = []
+    self.__lock = threading.Lock()
+
+    self.files_sent = 0
+    '''Number of new or changed files, which were transferred successfully.'''
+    self.bytes_sent = 0
+    '''Sum of sizes of the transferred files.'''
+    self.files_skipped = 0
+    '''Number of files skipped, because the destination is up to date.'''
+    self.bytes_skipped = 0
+    '''Sum of sizes of the skipped files.'''
+    self.files_deleted = 0
+    '''Number of deleted extraneous files and folders.'''
+
+  def __tree(self, remote):
+    return _remote_tree(self.__connection) if remote else _local_tree()
+
+  # Counts a finished transfer. Parallel transfers call it from worker threads.
+  def __sent(self, source: _sync_entry):
+    with self.__lock:
+      self.files_sent += 1
+      self.bytes_sent += source.size
+
+  def __transfer(self, source: _sync_entry, source_remote, destination: str, destination_remote):
+    logging.debug(f"Synchronizing {source.path} to {destination}.")
+
+    # Parallel transfers are counted, when they finish, and their failures are collected by the engine.
+    if self.__engine is not None and source_remote != destination_remote:
+      if source_remote:
+        self.__engine.pull(source.path, destination, on_success=lambda: self.__sent(source))
+      else:
+        self.__engine.push(source.path, destination, on_success=lambda: self.__sent(source))
+      return
+
+    # A failed file doesn't abort the synchronization of the others, as with parallel transfers.
+    try:
+      if source_remote and destination_remote:
+        self.__connection.fcp(source.path, destination)
+      elif source_remote:
+        self.__connection.pull(source.path, destination)
+      elif destination_remote:
+        self.__connection.push(source.path, destination)
+      else:
+        shutil.copyfile(source.path, destination)
+
+    except Exception as e:
+      logging.error(f"Transfer of {source.path} to {destination} failed: {e}")
+      self.__failures.append((source.path, destination, e))
+      return
+
+    self.__sent(source)
+
+  def __digest(self, tree, path):
+    import hashlib
+
+    digest = hashlib.sha256()
+
+    with tree.open(path) as f:
+      for block in iter(lambda: f.read(self.__checksum_block_size), b''):
+        digest.update(block)
+
+    return digest.digest()
+
+  def __changed(self, source: _sync_entry, source_tree, destination: _sync_entry, destination_tree) -> bool:
+    if self.__checksum:
+      return source.size != destination.size or self.__digest(source_tree, source.path) != self.__digest(destination_tree, destination.path)
+
+    if not self.__text_transmission and source.size != destination.size:
+      return True
+
+    return source.mtime > destination.mtime + max(self.__modify_window, destination.mtime_precision)
+
+  # Resolves a file in place of a folder or vice versa. Returns True, if the destination was removed.
+  def __conflict(self, source, destination, destination_tree) -> bool:
+    if self.__delete:
+      logging.info(f"Deleting {destination.path}, because its type differs from the source {source.path}.")
+      destination_tree.remove(destination.path)
+      self.files_deleted += 1
+      return True
+
+    error = InterruptedError(f"Cannot synchronize {source.path} to {destination.path}, because one of them is a folder and the other is not. Use delete mode to replace it.")
+    logging.error(str(error))
+    self.__failures.append((source.path, destination.path, error))
+    return False
+
+  def __sync_file(self, source, source_tree, source_remote, destination_path, destination, destination_tree, destination_remote):
+    if destination is not None:
+      if destination.is_dir:
+        if not self.__conflict(source, destination, destination_tree):
+          return
+
+      elif not self.__changed(source, source_tree, destination, destination_tree):
+        self.files_skipped += 1
+        self.bytes_skipped += source.size
+        return
+
+    self.__transfer(source, source_remote, destination_path, destination_remote)
+
+  def sync(self, source: GenericPath, destination: GenericPath):
+    '''Synchronizes a file or a folder to the destination. It has the same semantics as pcp -r - if the destination is an existing folder, the source is synchronized into it.
+    As in rsync, a source folder ending with a slash stands for its content, which is synchronized directly into the destination.
+
+    Args:
+      source: The file or folder to synchronize.
+      destination: The destination file or folder.
+    '''
+    logging.debug(f"Synchronizing {source.path} (remote={source.remote}) to {destination.path} (remote={destination.remote}).")
+
+    content_only = source.path.endswith('/')
+    source_path = path_normalize(source.path)
+
+    source_tree = self.__tree(source.remote)
+    destination_tree = self.__tree(destination.remote)
+
+    source_entry = source_tree.lookup(source_path)
+    if source_entry is None:
+      raise FileNotFoundError(f"Source file {source_path} doesn't exist.")
+
+    destination_path = path_normalize(destination.path)
+    destination_entry = destination_tree.lookup(destination_path)
+
+    if destination_entry is not None and destination_entry.is_dir and not (content_only and source_entry.is_dir):
+      destination_path = destination_tree.join(destination_path, os.path.basename(source_path))
+      destination_entry = destination_tree.lookup(destination_path)
+
+    if not source_entry.is_dir:
+      self.__sync_file(source_entry, source_tree, source.remote, destination_path, destination_entry, destination_tree, destination.remote)
+      return
+
+    if destination_entry is not None and not destination_entry.is_dir:
+      if not self.__conflict(source_entry, destination_entry, destination_tree):
+        return
+      destination_entry = None
+
+    if destination_entry is None:
+      destination_tree.mkdir(destination_path)
+
+    stack = [(source_path, destination_path, destination_entry is None)]
+
+    while stack:
+      s_dir, d_dir, d_dir_new = stack.pop()
+
+      s_entries = source_tree.entries(s_dir)
+      d_entries = {} if d_dir_new else destination_tree.entries(d_dir)
+
+      for name, s_entry in s_entries.items():
+        d_path = destination_tree.join(d_dir, name)
+        d_entry = d_entries.get(name)
+
+        if not s_entry.is_dir:
+          self.__sync_file(s_entry, source_tree, source.remote, d_path, d_entry, destination_tree, destination.remote)
+          continue
+
+        if d_entry is not None and not d_entry.is_dir:
+          if not self.__conflict(s_entry, d_entry, destination_tree):
+            continue
+          d_entry = None
+
+        if d_entry is None:
+          destination_tree.mkdir(d_path)
+
+        stack.append((s_entry.path, d_path, d_entry is None))
+
+      if self.__delete:
+        for name, d_entry in d_entries.items():
+          if name not in s_entries:
+            logging.info(f"Deleting extraneous {d_entry.path}.")
+            destination_tree.remove(d_entry.path)
+            self.files_deleted += 1
+
+  def close(self) -> list:
+    '''Waits for all scheduled transfers.
+
+    Returns:
+      A list of (source, destination, exception) triples of failed transfers and type conflicts.
+    '''
+    if self.__engine is not None:
+      self.__failures.extend(self.__engine.close())
+      self.__engine = None
+
+    return self.__failures
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
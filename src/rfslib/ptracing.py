@@ -0,0 +1,172 @@
+'''Tracing of public PConnection operations (eg. push, rpull, dcp, dmv, rm) and of the protected primitives called by them. A tracer is set by pconnection_settings.tracer.
+Without a tracer, no wrappers are installed, so tracing costs nothing.
+
+Every traced call is a span with the name of the method, its path arguments, transferred bytes (push, pull and their primitives) and the raised exception.
+Spans nest by the call chains - a span started inside another span (in the same thread or in a worker of PConnectionPool, which runs tasks in the context of the submitter) is its child.
+Subclasses of PTracer receive the spans by the callbacks on_start and on_end. PChromeTracer writes them as Chrome trace events, which can be opened in Perfetto (ui.perfetto.dev) or chrome://tracing,
+and rfslib.potel_tracer passes them to OpenTelemetry.'''
+
+import contextvars
+import json
+import os
+import threading
+import time
+
+
+# The innermost open span of the current thread or task.
+_current_span = contextvars.ContextVar('rfslib_current_span', default=None)
+
+
+class PSpan():
+  '''A traced call of a PConnection method.'''
+
+  def __init__(self, tracer, name: str, attributes: dict, parent):
+    self.tracer = tracer
+    '''The tracer, which started the span.'''
+    self.name = name
+    '''Name of the called method. (eg. 'rpull' or '_push')'''
+    self.attributes = attributes
+    '''Dictionary of the path arguments of the call (eg. remote_path, local_path) and of the transferred bytes ('bytes'), when the call ends.'''
+    self.parent = parent
+    '''The span of the call, which made this call, or None.'''
+    self.start = time.perf_counter()
+    '''Start of the call in seconds of time.perf_counter.'''
+    self.end = None
+    '''End of the call in seconds of time.perf_counter or None, if the call is running.'''
+    self.error = None
+    '''The exception raised by the call or None.'''
+    self.thread = threading.get_ident()
+    '''Identifier of the calling thread.'''
+    self.data = None
+    '''A value, which can be set by the tracer in on_start. (eg. a span of another tracing library)'''
+
+    self._token = None
+
+
+# Takes the arguments, which can be span attributes, by names of the parameters of the method.
+def _attributes(params, args, kwargs):
+  ret = {}
+
+  for name, value in zip(params, args):
+    if isinstance(value, (str, int, float, bool)):
+      ret[name] = value
+    elif isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value):
+      ret[name] = list(value)
+
+  for name, value in kwargs.items():
+    if isinstance(value, (str, int, float, bool)):
+      ret[name] = value
+
+  return ret
+
+
+class PTracer():
+  '''The base class of tracers. It tracks nesting of the spans, the subclasses override the callbacks on_start and on_end. The callbacks can be called by more threads at once.'''
+
+  def on_start(self, span: PSpan):
+    '''Called, when a traced call starts.'''
+    pass
+
+  def on_end(self, span: PSpan):
+    '''Called, when a traced call ends. span.end, span.error and span.attributes are final.'''
+    pass
+
+  def start_span(self, name: str, attributes: dict = {}) -> PSpan:
+    '''Starts a span, which becomes the parent of the spans started till its end in the current thread. Useful for tracing of application operations around PConnection calls.
+
+    Args:
+      name: Name of the span.
+      attributes: Dictionary of attributes of the span.
+    '''
+    parent = _current_span.get()
+    if parent is not None and parent.tracer is not self:
+      parent = None
+
+    span = PSpan(self, name, dict(attributes), parent)
+    span._token = _current_span.set(span)
+
+    self.on_start(span)
+    return span
+
+  def end_span(self, span: PSpan, error: BaseException = None):
+    '''Ends a span started by start_span.
+
+    Args:
+      span: The span.
+      error: The exception, which ended the traced operation, or None.
+    '''
+    span.end = time.perf_counter()
+    span.error = error
+
+    _current_span.reset(span._token)
+    self.on_end(span)
+
+  def wrap(self, name: str, function, params=(), size=None):
+    '''Returns a function, which calls function in a span.
+
+    Args:
+      name: Name of the spans.
+      function: The wrapped function.
+      params: Names of the positional parameters of function. Arguments of simple types are stored as attributes of the span.
+      size: A function, which gets the arguments of a successful call (with the same names) and returns the number of transferred bytes. (eg. size of the pushed file)
+    '''
+    def wrapper(*args, **kwargs):
+      span = self.start_span(name, _attributes(params, args, kwargs))
+
+      try:
+        ret = function(*args, **kwargs)
+      except BaseException as e:
+        self.end_span(span, e)
+        raise
+
+      if size is not None:
+        span.attributes['bytes'] = size(*args, **kwargs)
+
+      self.end_span(span)
+      return ret
+
+    return wrapper
+
+
+class PChromeTracer(PTracer):
+  '''A tracer, which collects the spans as Chrome trace events (complete events with names of threads). They are written by write as JSON, which can be opened in Perfetto or chrome://tracing.'''
+
+  def __init__(self):
+    '''The constructor of PChromeTracer. Timestamps of the events are relative to the creation of the tracer.'''
+    self.__origin = time.perf_counter()
+    self.__lock = threading.Lock()
+    self.__events = []
+    self.__threads = set()
+
+  def on_end(self, span: PSpan):
+    args = dict(span.attributes)
+    if span.error is not None:
+      args['error'] = f"{type(span.error).__name__}: {span.error}"
+
+    event = {
+      'name': span.name,
+      'cat': 'rfslib' if span.name.startswith('_') else 'rfslib.operation',
+      'ph': 'X',
+      'ts': (span.start - self.__origin) * 1e6,
+      'dur': (span.end - span.start) * 1e6,
+      'pid': os.getpid(),
+      'tid': span.thread,
+      'args': args,
+    }
+
+    with self.__lock:
+      if span.thread not in self.__threads:
+        self.__threads.add(span.thread)
+        self.__events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': span.thread, 'args': {'name': threading.current_thread().name}})
+
+      self.__events.append(event)
+
+  def events(self) -> list:
+    '''Returns a list of the collected trace events.'''
+    with self.__lock:
+      return list(self.__events)
+
+  def write(self, file: str):
+    '''Writes the collected events into a JSON file in the Chrome trace event format.'''
+    with open(file, 'w') as f:
+      json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, f)
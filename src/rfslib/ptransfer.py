@@ -0,0 +1,166 @@
+from rfslib.pconnection_pool import PConnectionPool
+
+import os, os.path
+import threading
+import time
+
+import logging
+
+
+class PTransferEngine():
+  '''Transfers files between the local and the remote storage in parallel over a pool of cloned connections.
+  Directories are created by the calling thread before any file is written into them. A failure of a single file transfer doesn't abort the others - all failures are collected and returned by close.'''
+
+  def __init__(self, connection, jobs: int):
+    '''The constructor of PTransferEngine.
+
+    Args:
+      connection: The PConnection used for directory operations. It is cloned for every worker.
+      jobs: Number of files transferred at once.
+    '''
+    self.__connection = connection
+    self.__pool = PConnectionPool(connection, jobs)
+
+    self.__lock = threading.Lock()
+    self.__failures = []
+    self.__files = 0
+    self.__bytes = 0
+
+    self.__start = time.monotonic()
+
+  def __fail(self, source, destination, exception):
+    logging.error(f"Transfer of {source} to {destination} failed: {exception}")
+
+    with self.__lock:
+      self.__failures.append((source, destination, exception))
+
+  def __submit(self, transfer, source, destination, size, on_success=None):
+    def done(future):
+      exception = future.exception()
+      if exception is not None:
+        self.__fail(source, destination, exception)
+      else:
+        with self.__lock:
+          self.__files += 1
+          self.__bytes += size or 0
+
+        if on_success is not None:
+          on_success()
+
+    self.__pool.submit(transfer, source, destination).add_done_callback(done)
+
+  def push(self, local_path: str, remote_path: str, recursive: bool = False, on_success=None):
+    '''Schedules upload of a local file to the remote storage. It has the same semantics as PConnection.push, or PConnection.rpush, if recursive is True.
+    on_success is called without arguments by a worker thread, after a single file is uploaded successfully.'''
+    logging.debug(f"Scheduling push of local file {local_path} to the remote file {remote_path} (recursive={recursive}).")
+
+    try:
+      if recursive and os.path.isdir(local_path):
+        self.__push_tree(local_path, remote_path)
+      else:
+        self.__submit(lambda c, l, r: c.push(l, r), local_path, remote_path, os.path.getsize(local_path), on_success)
+
+    except Exception as e:
+      self.__fail(local_path, remote_path, e)
+
+  def __push_tree(self, local_path, remote_path):
+    conn = self.__connection
+
+    if conn.lexists(remote_path):
+      if not conn.isdir(remote_path):
+        raise InterruptedError(f"Cannot upload a folder {local_path} to a non-folder path {remote_path}.")
+      stack = [(local_path, remote_path, False)]
+    else:
+      stack = [(local_path, remote_path, True)]
+
+    while stack:
+      l_dir, r_dir, r_dir_new = stack.pop()
+
+      try:
+        if r_dir_new:
+          conn.mkdir(r_dir)
+          remote_types = {}
+        else:
+          remote_types = {entry.name: entry.is_dir() for entry in conn.scandir(r_dir)}
+
+        with os.scandir(l_dir) as it:
+          for entry in it:
+            r_path = os.path.join(r_dir, entry.name)
+
+            if entry.is_dir():
+              if entry.name in remote_types and not remote_types[entry.name]:
+                self.__fail(entry.path, r_path, InterruptedError(f"Cannot upload a folder {entry.path} to a non-folder path {r_path}."))
+              else:
+                stack.append((entry.path, r_path, entry.name not in remote_types))
+
+            elif remote_types.get(entry.name):
+              self.__fail(entry.path, r_path, InterruptedError(f"Cannot upload a non-folder {entry.path} to a folder path {r_path}"))
+
+            else:
+              self.__submit(lambda c, l, r: c.push(l, r), entry.path, r_path, entry.stat().st_size)
+
+      except Exception as e:
+        self.__fail(l_dir, r_dir, e)
+
+  def pull(self, remote_path: str, local_path: str, recursive: bool = False, on_success=None):
+    '''Schedules download of a remote file to the local storage. It has the same semantics as PConnection.pull, or PConnection.rpull, if recursive is True.
+    on_success is called without arguments by a worker thread, after a single file is downloaded successfully.'''
+    logging.debug(f"Scheduling pull of remote file {remote_path} to the local file {local_path} (recursive={recursive}).")
+
+    try:
+      if recursive and self.__connection.isdir(remote_path):
+        self.__pull_tree(remote_path, local_path)
+      else:
+        self.__submit(lambda c, r, l: c.pull(r, l), remote_path, local_path, None, on_success)
+
+    except Exception as e:
+      self.__fail(remote_path, local_path, e)
+
+  def __pull_tree(self, remote_path, local_path):
+    stack = [(remote_path, local_path)]
+
+    while stack:
+      r_dir, l_dir = stack.pop()
+
+      try:
+        if os.path.lexists(l_dir):
+          if not os.path.isdir(l_dir):
+            raise InterruptedError(f"Cannot download a folder {r_dir} to a non-folder path {l_dir}.")
+        else:
+          os.mkdir(l_dir)
+
+        for entry in self.__connection.scandir(r_dir):
+          l_path = os.path.join(l_dir, entry.name)
+
+          if entry.is_dir():
+            stack.append((entry.path, l_path))
+
+          elif os.path.isdir(l_path):
+            self.__fail(entry.path, l_path, InterruptedError(f"Cannot download a non-folder {entry.path} to a folder path {l_path}."))
+
+          else:
+            st = entry.lstat()
+            self.__submit(lambda c, r, l: c.pull(r, l), entry.path, l_path, st.st_size if st is not None else None)
+
+      except Exception as e:
+        self.__fail(r_dir, l_dir, e)
+
+  def close(self) -> list:
+    '''Waits for all scheduled transfers and closes the worker connections.
+
+    Returns:
+      A list of (source, destination, exception) triples of failed transfers.
+    '''
+    self.__pool.close()
+
+    duration = time.monotonic() - self.__start
+    logging.info(f"Transferred {self.__files} files ({self.__bytes} bytes) in {duration:.2f} s using {self.__pool.get_size()} connections. " +
+      f"{len(self.__failures)} transfers failed.")
+
+    return self.__failures
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
@@ -0,0 +1,159 @@
+'''Iterative walks of remote trees and deletions of whole trees used by PConnection.walk, find and rm. Every folder is listed once by a typed listing (scandir),
+so a walk costs one round trip per folder. The module is imported only by commands, which walk trees.'''
+
+from collections import deque
+import stat
+
+from rfslib.pconnection_pool import PConnectionPool
+
+
+def is_walkable(connection, remote_path: str) -> bool:
+  '''Returns True, if remote_path is a folder, which isn't a symlink. (A protocol, which doesn't report modes, can't report symlinks.)'''
+  if not connection.isdir(remote_path):
+    return False
+
+  mode = connection.lstat(remote_path).st_mode
+  return mode is None or not stat.S_ISLNK(mode)
+
+
+# Lists a folder by one round trip. Returns a pair (dirs, nondirs) or None, if the folder can't be listed and onerror is given.
+def _list(scandir, remote_path, onerror):
+  try:
+    entries = list(scandir(remote_path))
+
+  except OSError as e:
+    if onerror is None:
+      raise
+
+    onerror(e)
+    return None
+
+  dirs, nondirs = [], []
+  for entry in entries:
+    if entry.is_dir() and not entry.is_symlink():
+      dirs.append(entry)
+    else:
+      nondirs.append(entry)
+
+  return dirs, nondirs
+
+
+def walk(scandir, remote_path: str, top_down: bool, onerror):
+  '''Walks the tree of a folder. It has the same semantics as PConnection.walk, but the existence and the type of remote_path aren't checked.
+
+  Args:
+    scandir: Function, which returns p_dir_entry objects of a folder known to exist.
+    remote_path: The normalized remote path of a remote folder.
+    top_down: If True, a folder is yielded before its subfolders. Otherwise a folder is yielded after all its subfolders.
+    onerror: A function called with the OSError raised by listing of a folder or None.
+  '''
+  if top_down:
+    # A stack of the folders waiting to be walked.
+    stack = [remote_path]
+
+    while stack:
+      dirpath = stack.pop()
+      listing = _list(scandir, dirpath, onerror)
+
+      if listing is None:
+        continue
+
+      dirs, nondirs = listing
+      yield dirpath, dirs, nondirs
+
+      stack.extend(entry.path for entry in reversed(dirs))
+
+    return
+
+  # A stack of frames [dirpath, dirs, nondirs, index of the next walked subfolder] of the folders on the current path.
+  listing = _list(scandir, remote_path, onerror)
+  stack = [[remote_path, *listing, 0]] if listing is not None else []
+
+  while stack:
+    frame = stack[-1]
+    dirpath, dirs, nondirs, i = frame
+
+    if i < len(dirs):
+      frame[3] += 1
+      listing = _list(scandir, dirs[i].path, onerror)
+
+      if listing is not None:
+        stack.append([dirs[i].path, *listing, 0])
+
+    else:
+      stack.pop()
+      yield dirpath, dirs, nondirs
+
+
+def rm_tree(connection, scandir, remote_path: str, jobs: int):
+  '''Deletes a tree by a bottom-up walk. It has the same semantics as PConnection.rm with recursive, but the existence of remote_path isn't checked.
+
+  Args:
+    connection: The PConnection, which walks the tree. With more than one job, it is cloned for every job.
+    scandir: Function, which returns p_dir_entry objects of a folder known to exist.
+    remote_path: The normalized remote path of a file or a tree.
+    jobs: Number of files and folders deleted at once.
+
+  Returns:
+    A pair (number of deleted nondirectory files, number of deleted folders).
+  '''
+  if not is_walkable(connection, remote_path):
+    connection._unlink(remote_path)
+    return 1, 0
+
+  if jobs <= 1:
+    files, folders = 0, 0
+
+    for dirpath, dirs, nondirs in walk(scandir, remote_path, False, None):
+      for entry in nondirs:
+        connection._unlink(entry.path)
+
+      connection._rmdir(dirpath)
+      files, folders = files + len(nondirs), folders + 1
+
+    return files, folders
+
+  with PConnectionPool(connection, jobs) as pool:
+    return _rm_tree_concurrently(scandir, remote_path, pool)
+
+
+# The walk yields subfolders before their parent, so the folders are removed in the order of the walk. A folder waits (without blocking the walk) till unlinks of its files and removals of its subfolders are done.
+def _rm_tree_concurrently(scandir, remote_path, pool):
+  files, folders = 0, 0
+
+  # Futures of removals of the folders, which aren't awaited by their parent yet.
+  removed = {}
+  # Folders in the order of the walk as tuples (dirpath, futures of unlinks of its files, paths of its subfolders).
+  waiting = deque()
+
+  def remove_ready(block):
+    nonlocal folders
+
+    while waiting:
+      dirpath, futures, subfolders = waiting[0]
+      futures = futures + [removed[path] for path in subfolders]
+
+      if not block and not all(future.done() for future in futures):
+        return
+
+      for future in futures:
+        future.result()
+
+      for path in subfolders:
+        del removed[path]
+
+      waiting.popleft()
+      removed[dirpath] = pool.submit(lambda connection, path: connection._rmdir(path), dirpath)
+      folders += 1
+
+  for dirpath, dirs, nondirs in walk(scandir, remote_path, False, None):
+    futures = [pool.submit(lambda connection, path: connection._unlink(path), entry.path) for entry in nondirs]
+    files += len(nondirs)
+
+    waiting.append((dirpath, futures, [entry.path for entry in dirs]))
+    remove_ready(False)
+
+  remove_ready(True)
+  removed.pop(remote_path).result()
+
+  return files, folders
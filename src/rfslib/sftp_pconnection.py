@@ -1,9 +1,27 @@
 import paramiko
+from paramiko.sftp import CMD_EXTENDED, CMD_STATUS, SFTP_OK, SFTP_OP_UNSUPPORTED, int64
 from rfslib import abstract_pconnection, pconnection_settings
 
-from stat import S_ISDIR
+from stat import S_ISDIR, S_ISLNK
+import posixpath
+import shlex
+import socket
 import logging
 
+# Seconds, in which the shell of the SSH server has to start a command executed for a server side copy.
+_exec_timeout = 10
+_exec_marker = 'rfstools-exec'
+
+class _sftp_response():
+  '''Receiver of a response to an asynchronous SFTP request.'''
+  t = None
+  msg = None
+
+  def _async_response(self, t, msg, num):
+    self.t = t
+    self.msg = msg
+
+
 class SftpPConnection(abstract_pconnection.PConnection):
   '''Class for SFTP connection. Public interface with an exception of __init__ and close is inherited from PConnection.'''
 
@@ -21,6 +39,9 @@ class SftpPConnection(abstract_pconnection.PConnection):
     '''
     super().__init__(settings)
 
+    self.__connection_args = dict(host=host, username=username, password=password, keyfile=keyfile, 
+      port=port, no_host_key_checking=no_host_key_checking)
+
     client = paramiko.SSHClient()    
 
     host_key_policy = None
@@ -43,12 +64,28 @@ class SftpPConnection(abstract_pconnection.PConnection):
 
     self.__sftp = client.open_sftp()
 
+    # Server side copy methods. None means, that the support hasn't been detected yet.
+    self.__copy_data = None
+    self.__exec_cp = None
+
   def close(self):
     self.__sftp.close()
+
+  def clone(self):
+    return SftpPConnection(self.get_settings(), **self.__connection_args)
   
   def _listdir(self, remote_path):
     return self.__sftp.listdir(path=remote_path)
 
+  def _scandir(self, remote_path):
+    for attr in self.__sftp.listdir_attr(path=remote_path):
+      path = posixpath.join(remote_path, attr.filename)
+
+      if attr.st_mode is None or S_ISLNK(attr.st_mode):
+        yield abstract_pconnection.p_dir_entry(path, self._isdir(path), attr.st_mode is not None, attr)
+      else:
+        yield abstract_pconnection.p_dir_entry(path, S_ISDIR(attr.st_mode), False, attr)
+
   def _rename(self, old_name, new_name):
     self.__sftp.rename(old_name, new_name) 
 
@@ -57,6 +94,101 @@ class SftpPConnection(abstract_pconnection.PConnection):
 
   def _pull(self, remote_path, local_path):
     self.__sftp.get(remote_path, local_path)
+
+  def _open(self, remote_path, mode):
+    return self.__sftp.open(remote_path, mode)
+
+  def _server_copy(self, remote_path, new_remote_path):
+    if self.__copy_data is not False:
+      self.__copy_data = self.__try_copy_data(remote_path, new_remote_path)
+      if self.__copy_data:
+        return
+
+    if self.__exec_cp is not False:
+      self.__exec_cp = self.__try_exec_cp(remote_path, new_remote_path)
+      if self.__exec_cp:
+        return
+
+    raise NotImplementedError("The SFTP server supports neither copy-data extension nor execution of cp.")
+
+  def _copy_range(self, src, src_offset, length, dst, dst_offset):
+    if self.__copy_data is not False:
+      # Buffered writes must reach the server before it writes the range.
+      dst.flush()
+
+      self.__copy_data = self.__copy_data_request(src.handle, src_offset, length, dst.handle, dst_offset)
+      if self.__copy_data:
+        return
+
+    super()._copy_range(src, src_offset, length, dst, dst_offset)
+
+  def __try_copy_data(self, remote_path, new_remote_path) -> bool:
+    with self.__sftp.open(remote_path, 'rb') as src, self.__sftp.open(new_remote_path, 'wb') as dst:
+      # Length 0 means copying till the end of the file.
+      return self.__copy_data_request(src.handle, 0, 0, dst.handle, 0)
+
+  # The copy-data extension (draft-ietf-secsh-filexfer-extensions-00) copies between two open handles on the server. It is supported by OpenSSH 9.0 and newer.
+  # Paramiko doesn't keep the extensions announced by the server, so the support is detected by the status of the first request.
+  def __copy_data_request(self, src_handle, src_offset, length, dst_handle, dst_offset) -> bool:
+    response = _sftp_response()
+    self.__sftp._async_request(response, CMD_EXTENDED, 'copy-data', src_handle, int64(src_offset), int64(length), dst_handle, int64(dst_offset))
+
+    while response.t is None:
+      self.__sftp._read_response()
+
+    if response.t != CMD_STATUS:
+      raise IOError(f"Unexpected response {response.t} to copy-data request.")
+
+    code = response.msg.get_int()
+    text = response.msg.get_text()
+
+    if code == SFTP_OK:
+      return True
+    elif code == SFTP_OP_UNSUPPORTED:
+      logging.debug(f"The SFTP server doesn't support copy-data extension: {text}")
+      return False
+    else:
+      raise IOError(text)
+
+  # The cp is run in the home directory of the user, the same as the SFTP session starts in. The shell prints a marker before the cp, so a server, which doesn't run the command
+  # (eg. ForceCommand internal-sftp, which waits for SFTP requests on stdin) is recognized by the missing marker. Stdin is closed and the marker is awaited for at most
+  # _exec_timeout seconds, the cp itself may take longer.
+  def __try_exec_cp(self, remote_path, new_remote_path) -> bool:
+    try:
+      channel = self.__sftp.get_channel().get_transport().open_session()
+
+      try:
+        channel.settimeout(_exec_timeout)
+        channel.exec_command(f"echo {_exec_marker} && cp -- {shlex.quote(remote_path)} {shlex.quote(new_remote_path)}")
+        channel.shutdown_write()
+
+        if channel.makefile('rb').readline().strip() != _exec_marker.encode():
+          logging.debug("The SSH server doesn't run commands in a shell.")
+          return False
+
+        channel.settimeout(None)
+        stderr = channel.makefile_stderr('rb').read().decode(errors='replace')
+        status = channel.recv_exit_status()
+
+      finally:
+        channel.close()
+
+    except socket.timeout:
+      logging.debug(f"The SSH server didn't start cp in {_exec_timeout} seconds.")
+      return False
+
+    except paramiko.SSHException as e:
+      logging.debug(f"The SSH server doesn't allow execution of cp: {e}")
+      return False
+
+    # 126 and 127 are returned by the shell, when the command can't be run.
+    if status in (126, 127):
+      logging.debug(f"The SSH server can't execute cp: {stderr}")
+      return False
+    elif status != 0:
+      raise IOError(f"Remote cp of {remote_path} to {new_remote_path} failed: {stderr}")
+
+    return True
   
   def _isdir(self, remote_path):
     result = False
@@ -3,6 +3,64 @@ from smb.SMBConnection import SMBConnection
 from rfslib import abstract_pconnection, pconnection_settings
 import socket
 from os.path import split
+import posixpath
+import io
+
+class _smb12_file():
+  '''Binary file on a SMB server accessed by ranged reads and writes. Every read and write is a separate request, so the file is supposed to be buffered.'''
+
+  def __init__(self, smb, service_name, path, mode):
+    self.__smb = smb
+    self.__service_name = service_name
+    self.__path = path
+    self.__mode = mode
+
+    self.__position = 0
+
+    if mode != 'rb':
+      # Creates the file, if it doesn't exist.
+      self.__smb.storeFileFromOffset(service_name, path, io.BytesIO(), 0, truncate=mode == 'wb')
+
+    if mode == 'ab':
+      self.__position = self.__size()
+
+  def __size(self):
+    return self.__smb.getAttributes(self.__service_name, self.__path).file_size
+
+  def seekable(self):
+    return self.__mode != 'ab'
+
+  def read(self, size=-1):
+    buffer = io.BytesIO()
+    self.__smb.retrieveFileFromOffset(self.__service_name, self.__path, buffer, self.__position, size)
+
+    data = buffer.getvalue()
+    self.__position += len(data)
+    return data
+
+  def write(self, data):
+    self.__smb.storeFileFromOffset(self.__service_name, self.__path, io.BytesIO(data), self.__position)
+    self.__position += len(data)
+    return len(data)
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_CUR:
+      offset += self.__position
+    elif whence == io.SEEK_END:
+      offset += self.__size()
+
+    if offset < 0:
+      raise ValueError(f"Negative seek position {offset}.")
+
+    self.__position = offset
+    return self.__position
+
+  def tell(self):
+    return self.__position
+
+  def close(self):
+    pass
+
 
 class Smb12PConnection(abstract_pconnection.PConnection):
   '''Class for SMB connection version 1 or 2. Public interface with an exception of __init__ and close is inherited from PConnection.'''
@@ -24,6 +82,9 @@ class Smb12PConnection(abstract_pconnection.PConnection):
     '''
     super().__init__(settings)
 
+    self.__connection_args = dict(host=host, service_name=service_name, username=username, password=password, 
+      port=port, use_direct_tcp=use_direct_tcp, client_name=client_name, use_ntlm_v1=use_ntlm_v1)
+
     self.__service_name = service_name
     self.__smb = SMBConnection(username, password, client_name, host,
       use_ntlm_v2=not use_ntlm_v1, is_direct_tcp=use_direct_tcp)
@@ -38,11 +99,19 @@ class Smb12PConnection(abstract_pconnection.PConnection):
 
   def close(self):
     self.__smb.close()
+
+  def clone(self):
+    return Smb12PConnection(self.get_settings(), **self.__connection_args)
   
   def _listdir(self, remote_path):
     l = self.__smb.listPath(self.__service_name, remote_path)
     return map (lambda x: x.filename, l)
 
+  def _scandir(self, remote_path):
+    for attr in self.__smb.listPath(self.__service_name, remote_path):
+      attr.st_mode_smb12 = self.__get_mode(attr)
+      yield abstract_pconnection.p_dir_entry(posixpath.join(remote_path, attr.filename), attr.isDirectory, False, attr)
+
   def _rename(self, old_name, new_name):
     self.__smb.rename(self.__service_name, old_name, new_name) 
 
@@ -54,6 +123,12 @@ class Smb12PConnection(abstract_pconnection.PConnection):
     with open(local_path, "wb") as local_file:
       self.__smb.retrieveFile(self.__service_name, remote_path, local_file)
   
+  def _open(self, remote_path, mode):
+    if mode == 'r+b':
+      raise NotImplementedError("Random access writes are not supported.")
+
+    return _smb12_file(self.__smb, self.__service_name, remote_path, mode)
+
   def _isdir(self, remote_path):
     attr = self.__smb.getAttributes(self.__service_name, remote_path)
     return attr.isDirectory
@@ -1,11 +1,15 @@
 import smbclient as smb
 import smbclient.path as spath
+from smbprotocol.file_info import FileAttributes
+from smbprotocol.exceptions import SMBOSError
+from smbprotocol.header import NtStatus
 
 from rfslib import abstract_pconnection, pconnection_settings
 import socket
 from os.path import split
 
 import shutil, stat
+import posixpath
 
 def config_smb23(username: str = None, password: str = None, no_dfs: bool = False, disable_secure_negotiate: bool = False, dfs_domain_controller: str = None, auth_protocol: str = 'negotiate'):
   '''The procedure changes global setting for SMB version 2 or 3 across all connection. Don't change value, if any SMB connection version 2 or 3 is active.
@@ -36,6 +40,34 @@ def _contain_toxic_char(remote_path):
   return False
 
 
+def _dir_entry_stat(entry):
+  '''Makes a stat result from attributes, which come together with a directory listing. It follows the st_mode construction of smbclient.stat.'''
+  info = entry.smb_info
+
+  st = abstract_pconnection.p_stat_result()
+
+  if entry.is_symlink():
+    st.st_mode = stat.S_IFLNK
+  elif info.file_attributes & FileAttributes.FILE_ATTRIBUTE_DIRECTORY:
+    st.st_mode = stat.S_IFDIR | 0o111
+  else:
+    st.st_mode = stat.S_IFREG
+
+  if info.file_attributes & FileAttributes.FILE_ATTRIBUTE_READONLY:
+    st.st_mode |= 0o444
+  else:
+    st.st_mode |= 0o666
+
+  st.st_size = info.end_of_file
+  st.st_mtime = info.last_write_time.timestamp()
+  st.st_atime = info.last_access_time.timestamp()
+  st.st_uid = 0
+  st.st_gid = 0
+  st.st_nlink = 1
+
+  return st
+
+
 class Smb23PConnection(abstract_pconnection.PConnection):
   '''Class for SMB connection version 2 or 3. Public interface with an exception of __init__ and close is inherited from PConnection.'''
 
@@ -57,57 +89,97 @@ class Smb23PConnection(abstract_pconnection.PConnection):
     self.__service_name = service_name
     self.__host = host
 
+    self.__connection_args = dict(host=host, service_name=service_name, username=username, password=password, 
+      port=port, enable_encryption=enable_encryption, dont_require_signing=dont_require_signing)
+
+    # Every connection has its own smbclient connection cache, so clones are independent SMB sessions.
+    self.__connection_cache = {}
+    self.__smb_kwargs = dict(port=port, connection_cache=self.__connection_cache)
+
     smb.register_session(host, username=username, password=password,
-      port=port, encrypt=enable_encryption, require_signing=not dont_require_signing)
+      encrypt=enable_encryption, require_signing=not dont_require_signing, **self.__smb_kwargs)
 
 
   def close(self):
-    pass
+    smb.reset_connection_cache(fail_on_error=False, connection_cache=self.__connection_cache)
+
+  def clone(self):
+    return Smb23PConnection(self.get_settings(), **self.__connection_args)
 
   def __prefix_path(self, path):
     return '\\\\' + self.__host + '\\' + self.__service_name + '\\' + path
 
   def _listdir(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
-    return smb.listdir(p_remote_path)
+    return smb.listdir(p_remote_path, **self.__smb_kwargs)
+
+  def _scandir(self, remote_path):
+    p_remote_path = self.__prefix_path(remote_path)
+
+    with smb.scandir(p_remote_path, **self.__smb_kwargs) as it:
+      entries = [abstract_pconnection.p_dir_entry(posixpath.join(remote_path, entry.name), entry.is_dir(), entry.is_symlink(), _dir_entry_stat(entry)) 
+        for entry in it]
+
+    return entries
 
   def _rename(self, old_name, new_name):
     p_old_name = self.__prefix_path(old_name)
     p_new_name = self.__prefix_path(new_name)
     
-    smb.rename(p_old_name, p_new_name)
+    smb.rename(p_old_name, p_new_name, **self.__smb_kwargs)
 
   def _push(self, local_path, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    with open(local_path, "rb") as local_file, smb.open_file(p_remote_path, "wb") as remote_file:
+    with open(local_path, "rb") as local_file, smb.open_file(p_remote_path, "wb", **self.__smb_kwargs) as remote_file:
       shutil.copyfileobj(local_file, remote_file)
 
   def _pull(self, remote_path, local_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    with smb.open_file(p_remote_path, "rb") as remote_file, open(local_path, "wb") as local_file:
+    with smb.open_file(p_remote_path, "rb", **self.__smb_kwargs) as remote_file, open(local_path, "wb") as local_file:
       shutil.copyfileobj(remote_file, local_file)
+
+  def _open(self, remote_path, mode):
+    if mode == 'r+b':
+      raise NotImplementedError("Random access writes are not supported.")
+
+    p_remote_path = self.__prefix_path(remote_path)
+
+    return smb.open_file(p_remote_path, mode, buffering=0, **self.__smb_kwargs)
+
+  def _server_copy(self, remote_path, new_remote_path):
+    p_remote_path = self.__prefix_path(remote_path)
+    p_new_remote_path = self.__prefix_path(new_remote_path)
+
+    # smbclient.copyfile copies by FSCTL_SRV_COPYCHUNK, so the data don't leave the server.
+    try:
+      smb.copyfile(p_remote_path, p_new_remote_path, **self.__smb_kwargs)
+
+    except SMBOSError as e:
+      if e.ntstatus in (NtStatus.STATUS_NOT_SUPPORTED, NtStatus.STATUS_INVALID_DEVICE_REQUEST):
+        raise NotImplementedError(f"The SMB server doesn't support FSCTL_SRV_COPYCHUNK: {e}")
+      raise
   
   def _isdir(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    return spath.isdir(p_remote_path)
+    return spath.isdir(p_remote_path, **self.__smb_kwargs)
   
   def _mkdir(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    smb.mkdir(p_remote_path)
+    smb.mkdir(p_remote_path, **self.__smb_kwargs)
 
   def _rmdir(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    smb.mkdir(p_remote_path)
+    smb.rmdir(p_remote_path, **self.__smb_kwargs)
 
   def _unlink(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    smb.unlink(p_remote_path)
+    smb.unlink(p_remote_path, **self.__smb_kwargs)
 
   def _exists(self, remote_path):
     if remote_path == '' or _contain_toxic_char(remote_path):
@@ -115,7 +187,7 @@ class Smb23PConnection(abstract_pconnection.PConnection):
 
     p_remote_path = self.__prefix_path(remote_path)
 
-    return spath.exists(p_remote_path)
+    return spath.exists(p_remote_path, **self.__smb_kwargs)
   
   def _lexists(self, remote_path):
     if remote_path == '' or _contain_toxic_char(remote_path):
@@ -123,16 +195,16 @@ class Smb23PConnection(abstract_pconnection.PConnection):
 
     p_remote_path = self.__prefix_path(remote_path)
 
-    return spath.lexists(p_remote_path)
+    return spath.lexists(p_remote_path, **self.__smb_kwargs)
 
   def _stat(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
 
-    return smb.stat(p_remote_path)
+    return smb.stat(p_remote_path, **self.__smb_kwargs)
 
   def _lstat(self, remote_path):
     p_remote_path = self.__prefix_path(remote_path)
     
-    return smb.lstat(p_remote_path)
+    return smb.lstat(p_remote_path, **self.__smb_kwargs)
 
 